@@ -8,12 +8,27 @@ import json
 from collections import defaultdict
 import numpy as np
 from pathlib import Path
-import matplotlib.pyplot as plt
-from chartmaker_2_2 import plot_line, plot_histogram, plot_pie, read_json_data, extract_segments, \
-    plot_boxplot, plot_density
-import pandas as pd
+from storage import open_store
+from heartbeat_log import RECORD_DTYPE
+from history_cache import HistoryCache
+from write_behind import WriteBehindQueue
+from snapshot import write_snapshot, read_snapshot
+from rollup import tier_cutoffs
+from tester_ledger import TesterLedger
+from heartbeat_parser import parse_heartbeat
+from roller_state import RollerStatus
+from roller_board import RollerBoard
+from ingest_queue import IngestQueue
+from board_editor import BoardEditor, paginate
+from refresh_scheduler import RefreshScheduler
+from expiry_timer import ExpiryTimer
+from warning_digest import WarningDigest, read_cooldowns, write_cooldowns
+from roller_baseline import BaselineTracker
+from chart_renderer import ChartRenderer, ChartQueueFull, CHART_TYPES
+from chart_cache import ChartCache
+import io
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 # Load environment variables
 load_dotenv()
@@ -22,7 +37,8 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
 intents.members = True  # Enable the GUILD_MEMBERS intent
-bot = commands.Bot(command_prefix="/", intents=intents)
+board_editor = BoardEditor()  # Skips unchanged status board edits and reads the rate limit headers of the bot's edits
+bot = commands.Bot(command_prefix="/", intents=intents, http_trace=board_editor.trace_config())
 
 ################################################################################
 # Configuration Variables
@@ -31,6 +47,8 @@ TARGET_USER_ID = 810203371486707732  # Replace with the user's ID
 SOURCE_CHANNEL_ID = 984469411815624714  # Replace with the channel to read messages from
 DESTINATION_CHANNEL_ID = 1331992584993771551  # Replace with the channel to send messages to
 WARNING_CHANNEL_ID = 1331992584993771551  # Replace with the warning channel's ID
+# Every (webhook user id, channel id) that posts heartbeats, each one gets its own queue and worker
+HEARTBEAT_SOURCES = [(TARGET_USER_ID, SOURCE_CHANNEL_ID)]
 MODERATOR_ROLE =  [1131602502576513114, 123, 123]  # Replace with the role ID required to react. Add as many as you need.
 
 # Define the forum channel ID and the tag IDs to exclude for the /mythreads command.
@@ -41,26 +59,80 @@ exclude_tag_id_2 = 1336665901642158102  # Dead tag ID
 YOUR_BOT_TOKEN = os.getenv("YOUR_DISCORD_TOKEN")
 SPECIFIC_EMOJI = "🧪"  # Replace with the desired emoji
 SUCCESS_EMOJI = "📝"  # Replace with the desired emoji
-if not YOUR_BOT_TOKEN:
-    raise ValueError("Bot token not found. Please set DISCORD_BOT_TOKEN in .env file.")
 
 # Timing and Limits
-EDIT_LOOP_TIMER = 30  # Message update frequency
+BOARD_DEBOUNCE = 5  # Seconds a new heartbeat waits for others before the status board is updated
+BOARD_MIN_INTERVAL = 15  # Min seconds between status board updates
+BOARD_REFRESH_INTERVAL = 60  # Seconds between updates without new heartbeats, keeps the "Xm" ages right
+BOARD_PAGE_LIMIT = 2000  # Discord's message length limit, the status board is split over as many messages as it needs
 OFFLINE_TIMER = 60 * 33  # 33 minutes offline threshold
 INSTANCE_BOLD_LIMIT = 4  # Min instances per user before warning
 PPH_WARNING_LIMIT = 100 # Min packs per hour limit
 WARNING_COOLDOWN = 2 * 60 * 60  # 2-hour cooldown for warnings
+# Every roller's packs per hour and online instances are also compared with their own usual values
+BASELINE_ALPHA = 0.1  # Weight of the newest heartbeat in a roller's usual values
+BASELINE_WARMUP = 10  # Heartbeats before a roller is judged by its own usual values
+BASELINE_MIN_DROP = 0.25  # Warn when a value is at least this far below usual (0.25 = 25%)...
+BASELINE_DEVIATIONS = 3  # ...and more standard deviations below it than this
+BASELINE_REPLACES_PPH_LIMIT = True  # Rollers with a baseline are not warned about PPH_WARNING_LIMIT, only about drops
+WARNING_DIGEST_WINDOW = 60  # Seconds warnings are collected before they are sent together in one message
+REACTION_TRACKING_TTL = 24 * 60 * 60  # Seconds the moderators who reacted to a message are remembered
+PERSIST_FLUSH_INTERVAL = 5  # Seconds between batched writes of userdata and testers to disk
+INGEST_QUEUE_SIZE = 1000  # Max heartbeats waiting per source, on_message waits for room when it is full
+INGEST_PUT_TIMEOUT = 10  # Seconds on_message waits for room before the heartbeat is dropped
+
+# Storage
+STORAGE_BACKEND = "files"  # "files" keeps one file per user in the folders below, "sqlite" uses SQLITE_PATH
+SQLITE_PATH = "heartbeat.db"  # Run "python sqlite_store.py migrate" once before switching to "sqlite"
+HISTORY_CACHE_USERS = 200  # Max users whose full history is kept in memory
+HISTORY_CACHE_MB = 64  # Max memory used by the histories kept in memory
+WARNING_COOLDOWNS_FILE = Path("warning_cooldowns.json")  # Time of the last warning of every user, kept across restarts
+SNAPSHOT_FILE = Path("state_snapshot.npz")  # In-memory state, loaded at startup instead of rebuilding it
+SNAPSHOT_INTERVAL = 5 * 60  # Seconds between snapshots, one is also written on shutdown
+RAW_RETENTION_DAYS = 14  # Heartbeats newer than this are kept as they are, keep it above the chart window
+HOURLY_RETENTION_DAYS = 90  # Older heartbeats are rolled up to hourly rows until this age, then to daily rows
+BACKFILL_MAX_HOURS = 24  # Heartbeats posted while the bot was offline are read back at startup up to this age, 0 turns it off
+COMPACTION_INTERVAL_HOURS = 6  # How often old history is rolled up and removed reactions are dropped from tester ledgers
+
+# Charts
+CHART_WORKERS = 2  # Processes making /pokechart charts
+CHART_MAX_QUEUED = 8  # Max charts waiting or being made, more requests are turned down
+CHART_TIMEOUT = 60  # Seconds before a chart request gives up
+CHART_CACHE_ENTRIES = 32  # Max charts kept to answer the same /pokechart again without making it
+CHART_CACHE_MB = 32  # Max memory used by the kept charts
+CHART_CACHE_WINDOW = 10 * 60  # Charts show the last days up to now, a kept chart is reused for at most this many seconds
 
 ################################################################################
 # Data Storage
 ################################################################################
-user_messages = {}
+user_messages = {} # Dictionary of heartbeat user id -> RollerStatus of the newest heartbeat
+# Online rollers sorted by last heartbeat, with the board totals kept up to date
+roller_board = RollerBoard(lambda status: describe_roller(status))
+# Updates the status board when heartbeats change it instead of on a fixed timer
+board_scheduler = RefreshScheduler(lambda: send_message_list(), BOARD_DEBOUNCE, BOARD_MIN_INTERVAL, BOARD_REFRESH_INTERVAL)
+board_refresh_task = None
+# Deadlines of ("roller", user id), ("warning", user id) and ("reactions", message id), the entries are dropped when they pass
+expiry_timer = ExpiryTimer(lambda key: expire_entry(*key), lambda: time.time())
+expiry_task = None
 allowed_mentions = discord.AllowedMentions(users=True)
-latest_sent_message = None
+board_messages = [] # Status board messages, one per page
 last_warning_timestamps = {}
+# Warnings are queued and sent together, at most one per user every WARNING_COOLDOWN seconds
+warning_digest = WarningDigest(last_warning_timestamps, WARNING_COOLDOWN, lambda: time.time())
+warning_scheduler = RefreshScheduler(lambda: send_warning_digest(), WARNING_DIGEST_WINDOW, WARNING_DIGEST_WINDOW,
+                                     60 * 60)  # Only sends something when warnings are queued
+warning_task = None
+# Usual PPH (from 40 minutes into a session, like the PPH warning) and online instances of every roller
+roller_baselines = BaselineTracker(BASELINE_ALPHA, BASELINE_WARMUP, BASELINE_DEVIATIONS, BASELINE_MIN_DROP, min_minutes=40)
+state_loaded = False # on_ready also fires on reconnects, only load the saved state once
+source_queues = {} # (webhook user id, channel id) -> IngestQueue of (Heartbeat, message id), drained after the backfill
+heartbeat_workers = [] # Worker task of every heartbeat source
+restored_board_message_ids = [] # Status message ids from the snapshot, edited instead of posting new ones
 message_reactions = {} # Dictionary to track reactions per message
 user_fourth_line_data = defaultdict(list) # Dictionary to store user data as a matrix
-user_fourth_line_data = {} # Dictionary to store user data as numpy arrays
+tester_summaries = {} # tester id -> [tests, last test time, removed reactions], loaded at startup
+tester_ledgers = {} # TesterLedger of the testers whose reactions changed, read on first use
+write_queue = WriteBehindQueue(flush_interval=PERSIST_FLUSH_INTERVAL) # Writes files from a background thread
 DATA_FOLDER = Path("userdata")
 DATA_FOLDER.mkdir(parents=True, exist_ok=True)  # Creates the folder if missing
 TESTERS_FOLDER = Path("testers")
@@ -72,182 +144,414 @@ DELETED_TESTERS_FOLDER.mkdir(parents=True, exist_ok=True) # Creates the folder i
 USERNAMES_DIRECTORY = "C:/Path/To/users.csv" # Where usernames are stored for the chart generation.
 # Stored in a CSV as "IGN","Friend_ID","Discord_ID","Godpacks","Livepacks","Timezone","Usernames","Last_Online"
 # Only need to store IGN and Discord_ID for this command. Example line in CSV: "Ingame name","","Discord_ID","","","","",""
+# Arguments of open_store, the chart workers open their own storage backend with them
+STORE_ARGS = ((STORAGE_BACKEND, DATA_FOLDER, TESTERS_FOLDER, DELETE_USERDATA_FOLDER, DELETED_TESTERS_FOLDER),
+              {"sqlite_path": SQLITE_PATH})
+store = open_store(*STORE_ARGS[0], **STORE_ARGS[1])
+# Charts are made in worker processes, /pokechart does not hold up heartbeats and the status board
+chart_renderer = ChartRenderer(STORE_ARGS, USERNAMES_DIRECTORY, max_workers=CHART_WORKERS,
+                               max_queued=CHART_MAX_QUEUED, timeout=CHART_TIMEOUT)
+# Made charts by (chart type, user, time window, data generation), new heartbeats move the generation on
+chart_cache = ChartCache(max_entries=CHART_CACHE_ENTRIES, max_bytes=CHART_CACHE_MB * 1024 * 1024)
+# Histories are loaded on first use and the least recently used ones are dropped from memory.
+# Users with queued writes stay loaded, their newest rows are not in storage yet.
+user_fourth_line_data = HistoryCache(store.read_heartbeats, max_users=HISTORY_CACHE_USERS,
+                                     max_bytes=HISTORY_CACHE_MB * 1024 * 1024,
+                                     can_evict=lambda user_id: not write_queue.is_pending(("userdata", user_id)))
 
 ################################################################################
 # Helper Functions
 ################################################################################
+def get_tester_ledger(user_id):
+    """The tester's TesterLedger, read from storage the first time the tester's reactions change."""
+    ledger = tester_ledgers.get(user_id)
+    if ledger is None:
+        if user_id in tester_summaries:
+            ledger = store.read_tester_ledger(user_id)
+        tester_ledgers[user_id] = ledger = ledger or TesterLedger()
+    return ledger
+
+def save_tester_op(user_id, op, payload):
+    """Queues an "add", "remove" or "compact" of a tester's ledger to be written by the background writer."""
+    def write(ops):
+        store.apply_tester_ops(user_id, ops)
+
+    write_queue.append(("testers", user_id), write, (op, payload))
+
 def increment_reaction_count(user_id, reactor_id):
-    """Adds a new reaction entry to the user's JSON file."""
-    file_path = TESTERS_FOLDER / f"{user_id}.json"
+    """Adds a new reaction entry to the user's tester data."""
+    ledger = get_tester_ledger(user_id)
+    new_entry = ledger.add(reactor_id, int(time.time()))  # Numbered after the current count
+    tester_summaries[user_id] = ledger.summary()
+    save_tester_op(user_id, "add", new_entry)
+
+def compact_tester_ledgers():
+    """Queues a rewrite of every tester ledger that has removed reactions in it."""
+    compacted = 0
+    for user_id, summary in tester_summaries.items():
+        if summary[2]:
+            ledger = get_tester_ledger(user_id)
+            save_tester_op(user_id, "compact", ledger.entries())
+            ledger.tombstones = summary[2] = 0
+            compacted += 1
+    return compacted
 
-    # Load existing data or initialize an empty list
-    if file_path.exists():
-        with open(file_path, "r") as f:
-            data = json.load(f)
-    else:
-        data = []
+async def get_channel(channel_id):
+    return discord.utils.get(bot.get_all_channels(), id=channel_id)
 
-    # Create a new reaction entry
-    reaction_number = len(data) + 1  # Increment reaction number
-    timestamp = int(time.time())  # Current Unix timestamp
-    new_entry = [reaction_number, timestamp, str(reactor_id)]  # New row
+async def ingest_heartbeats(batch, send_warnings=True):
+    """
+    Applies (heartbeat, message id) pairs of one user, oldest first. Every row is stored,
+    the status board and the warnings only look at the newest heartbeat.
+    Heartbeats that are not newer than the user's last one are skipped, which keeps every
+    user's history in order when the same user is seen by several sources or the backfill.
+    Returns the number of heartbeats applied.
+    """
+    applied, newest = 0, None
+    for heartbeat, message_id in batch:
+        summary = user_fourth_line_data.summaries.get(heartbeat.user_id)
+        if summary is not None and heartbeat.timestamp <= summary[2]:
+            continue
+        # Save the session time and packs for the user
+        save_fourth_line_numbers(heartbeat.user_id, heartbeat.minutes, heartbeat.packs, heartbeat.timestamp)
+        applied += 1
+        anomalies = roller_baselines.check(heartbeat.user_id, heartbeat.pph, heartbeat.online, heartbeat.minutes)
+        newest = heartbeat, message_id, anomalies
+    if newest is None:
+        return 0
+    chart_cache.bump(newest[0].user_id)  # Charts made from the user's older data are out of date
+
+    # The newest heartbeat replaces the roller's previous one
+    heartbeat, message_id, anomalies = newest
+    status = RollerStatus.from_heartbeat(heartbeat, message_id)
+    user_messages[heartbeat.user_id] = status
+    roller_board.update(status)
+    board_scheduler.mark_dirty()
+    expiry_timer.schedule(("roller", heartbeat.user_id), heartbeat.timestamp + OFFLINE_TIMER)
+
+    if not send_warnings:
+        return applied
+    if anomalies:  # Well below the roller's own usual values
+        queue_baseline_warning(heartbeat.user_id, anomalies)
+    # Warn about the PPH only if the session is 40 minutes or longer
+    elif heartbeat.minutes >= 40 and heartbeat.pph < PPH_WARNING_LIMIT and not (
+            BASELINE_REPLACES_PPH_LIMIT and roller_baselines.is_warm(heartbeat.user_id)):
+        queue_pph_warning(heartbeat.user_id, heartbeat.pph)
+    return applied
+
+def get_source_queue(source):
+    """Queue of a heartbeat source, created on first use so it belongs to the running event loop."""
+    if source not in source_queues:
+        source_queues[source] = IngestQueue(INGEST_QUEUE_SIZE, INGEST_PUT_TIMEOUT)
+    return source_queues[source]
+
+async def heartbeat_worker(source):
+    """Applies the heartbeats of one source, all waiting heartbeats of a user at once."""
+    queue = get_source_queue(source)
+    while True:
+        user_id, batch = await queue.get_batch()
+        try:
+            await ingest_heartbeats(batch)
+        except Exception as e:
+            print(f"Error processing heartbeats of {user_id} from channel {source[1]}: {e}")
+        finally:
+            await queue.task_done(len(batch))
+        await asyncio.sleep(0)  # Let the other sources' workers run, a busy source can't hold them up
 
-    # Append the new entry to the list
-    data.append(new_entry)
+def start_heartbeat_workers():
+    if not heartbeat_workers:
+        heartbeat_workers.extend(asyncio.create_task(heartbeat_worker(source)) for source in HEARTBEAT_SOURCES)
 
-    # Save the updated data back to the JSON file
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
+async def wait_for_heartbeats():
+    """Waits until every queued heartbeat has been applied."""
+    for queue in list(source_queues.values()):
+        await queue.join()
 
-async def get_channel(channel_id):
-    return discord.utils.get(bot.get_all_channels(), id=channel_id)
+async def backfill_heartbeats():
+    """
+    Reads the heartbeats posted in every source channel since the newest stored one and
+    applies them in order, so downtime does not leave gaps in the histories. Heartbeats
+    that arrive in the meantime wait in the source queues.
+    """
+    last_ts = max((summary[2] for summary in user_fourth_line_data.summaries.values()), default=None)
+    if last_ts is None or BACKFILL_MAX_HOURS <= 0:
+        return
+    since = max(last_ts, time.time() - BACKFILL_MAX_HOURS * 60 * 60)
+    # One second of overlap, heartbeats that are already stored are skipped per user
+    after = datetime.fromtimestamp(since - 1, tz=timezone.utc)
+
+    for channel_id in dict.fromkeys(channel_id for _, channel_id in HEARTBEAT_SOURCES):
+        authors = {author_id for author_id, source_channel_id in HEARTBEAT_SOURCES if source_channel_id == channel_id}
+        channel = await get_channel(channel_id)
+        if channel is None:
+            continue
+        applied = 0
+        try:
+            async for message in channel.history(limit=None, after=after, oldest_first=True):
+                if message.author.id not in authors:
+                    continue
+                heartbeat = parse_heartbeat(message.content, int(message.created_at.timestamp()))
+                if heartbeat is not None:
+                    applied += await ingest_heartbeats([(heartbeat, message.id)], send_warnings=False)  # Old news, no warnings
+        except discord.HTTPException as e:
+            print(f"Error reading heartbeat history of channel {channel_id}: {e}")
+        print(f"Backfilled {applied} heartbeats of channel {channel_id} posted since {after:%Y-%m-%d %H:%M} UTC.")
 
-async def send_pph_warning(user_id, pph):
-    current_time = int(time.time())
-    last_warning_time_2 = last_warning_timestamps.get(user_id, 0)
+def queue_pph_warning(user_id, pph):
+    """Adds the user to the next warning digest, unless they were warned less than WARNING_COOLDOWN ago."""
     display_id = user_id.split('-')[0]
     alt_text = " alt's" if "-" in user_id else ""  # Add ALT if user_id ends with -1
+    if warning_digest.add(user_id, f"<@{display_id}> Your{alt_text} packs per hour is {round(pph)} (Less than {PPH_WARNING_LIMIT})."):
+        warning_scheduler.mark_dirty()
 
-    if current_time - last_warning_time_2 >= WARNING_COOLDOWN:
-        warning_channel = await get_channel(WARNING_CHANNEL_ID)
-        if warning_channel:
-            warning_message = (f"<@{display_id}> Alert: Your{alt_text} packs per hour is {round(pph)} (Less than {PPH_WARNING_LIMIT}). "
-                               "Please check your setup.")
-            await warning_channel.send(warning_message, allowed_mentions=allowed_mentions)
-            last_warning_timestamps[user_id] = current_time
-            print(f"PPH Warning sent to <@{user_id}>")
+def queue_baseline_warning(user_id, anomalies):
+    """Adds the user to the next warning digest with the values that dropped below their usual."""
+    display_id = user_id.split('-')[0]
+    alt_text = " alt's" if "-" in user_id else ""  # Add ALT if user_id ends with -1
+    names = {"pph": "packs per hour", "online": "online instances"}
+    drops = ", ".join(f"{names[name]} is {round(value)} (usually {round(usual)})" for name, value, usual in anomalies)
+    if warning_digest.add(user_id, f"<@{display_id}> Your{alt_text} {drops}."):
+        warning_scheduler.mark_dirty()
+
+async def send_warning_digest():
+    """Sends the queued warnings as one message, split only when it is longer than Discord allows."""
+    if not warning_digest:
+        return
+    warning_channel = await get_channel(WARNING_CHANNEL_ID)
+    if not warning_channel:
+        return  # Kept for the next digest
+
+    sent_at, warnings = warning_digest.take()
+    for user_id, _ in warnings:
+        expiry_timer.schedule(("warning", user_id), sent_at + WARNING_COOLDOWN)
+    # Only the newest cooldowns are written
+    write_queue.replace(("warnings", "cooldowns"), lambda cooldowns: write_cooldowns(WARNING_COOLDOWNS_FILE, cooldowns),
+                        dict(last_warning_timestamps))
+
+    pages = paginate("**Alert:** Please check your setup.\n", [line for _, line in warnings], BOARD_PAGE_LIMIT)
+    try:
+        for page in pages:
+            await warning_channel.send(page, allowed_mentions=allowed_mentions)
+        print(f"PPH Warning sent to {', '.join(f'<@{user_id}>' for user_id, _ in warnings)}")
+    except discord.HTTPException as e:
+        print(f"Error sending warnings: {e}")
+
+def restore_warning_cooldowns(cooldowns):
+    """Adds saved cooldowns that are still running, the newest warning time of a user wins."""
+    now = time.time()
+    for user_id, warning_time in cooldowns.items():
+        if now - warning_time < WARNING_COOLDOWN and warning_time > last_warning_timestamps.get(user_id, 0):
+            last_warning_timestamps[user_id] = warning_time
+            expiry_timer.schedule(("warning", user_id), warning_time + WARNING_COOLDOWN)
+
+def expire_entry(kind, key):
+    """Drops the in-memory state whose deadline passed, so it does not grow with uptime."""
+    if kind == "roller":  # Silent for OFFLINE_TIMER seconds, off the board until its next heartbeat
+        user_messages.pop(key, None)
+        if roller_board.remove(key) is not None:
+            board_scheduler.mark_dirty()
+    elif kind == "warning":  # Cooldown is over, no timestamp means no cooldown
+        last_warning_timestamps.pop(key, None)
+    elif kind == "reactions":
+        message_reactions.pop(key, None)
+
+def describe_roller(status):
+    """
+    Parts of a roller's board line around its relative time (e.g. "10m"), worked out once
+    per heartbeat. Returns (text before the time, text after the time, bold).
+    """
+    alt_text = " ALT" if status.alt else ""  # Add ALT if user_id ends with -1
+    new_text = " NEW" if status.minutes == 0 else ""  # Add NEW if the session just started
+    bold = status.online < INSTANCE_BOLD_LIMIT or status.pph < PPH_WARNING_LIMIT
+    return f"<@{status.main_id}>{alt_text}", f"{status.online}/{status.instances} in. {round(status.pph)} pph{new_text}", bold
 
 async def send_message_list():
-    global latest_sent_message
     channel = await get_channel(DESTINATION_CHANNEL_ID)
     if not channel:
         return
 
-    message_list, total_instances, total_pph = [], 0, 0
-    current_time = int(time.time())
-
-    active_messages = {msg_id: data for msg_id, data in user_messages.items()
-                       if current_time - int(data["timestamp"].split(":")[1]) <= OFFLINE_TIMER}
-    sorted_messages = sorted(active_messages.values(), key=lambda x: x["timestamp"], reverse=True)
-
-    for data in sorted_messages:
-        total_instances += data["second_line_numbers"]
-        total_pph += data.get("pph", 0)
-
-        # Extract the timestamp from the Discord format
-        discord_timestamp = data["timestamp"]
-        timestamp_value = int(discord_timestamp.split(":")[1])
-
-        # Calculate the time difference in minutes
-        time_diff_minutes = (current_time - timestamp_value) // 60
-
-        # Format the relative time (e.g., "10m ago")
-        relative_time = f"{time_diff_minutes}m"
-
-        # Extract numeric user ID and check for ALT status
-        user_id_full = data['content']  # Full ID from backend
-        user_id_display = user_id_full.split('-')[0]  # Main numeric ID
-        alt_text = " ALT" if "-" in user_id_full else ""  # Add ALT if user_id ends with -1
-        new_text = " NEW" if data['time_user'] == 0 else ""  # Add NEW if second_line_numbers is 0
-
-        # Build the message line
-        line = f"<@{user_id_display}>{alt_text} {relative_time} {data['second_line_numbers']}/{data['tot_instances']} in. {round(data['pph'])} pph{new_text}"
-        message_list.append(f"**{line}**" if data["second_line_numbers"] < INSTANCE_BOLD_LIMIT or data[
-            "pph"] < PPH_WARNING_LIMIT else line)
-
-    message_content = (f"## Latest heart beats:\n"
-                       f"**{len(sorted_messages)} rollers | {total_instances} instances | {round(total_pph)} pph** \n" + "\n".join(
-        message_list))
+    current_time = int(time.time())  # Offline rollers were taken off by expiry_timer
+    header = (f"## Latest heart beats:\n"
+              f"**{len(roller_board)} rollers | {roller_board.instances} instances | {round(roller_board.pph)} pph** \n")
+    pages = paginate(header, roller_board.lines(current_time), BOARD_PAGE_LIMIT)
 
     try:
-        if latest_sent_message:
-            await latest_sent_message.edit(content=message_content)
-        else:
-            latest_sent_message = await channel.send(message_content, allowed_mentions=allowed_mentions)
+        for message, content in zip(board_messages, pages):
+            await board_editor.edit(message, content)  # Skipped if the page did not change
+        # More pages than messages, the new pages are posted below the others
+        for content in pages[len(board_messages):]:
+            message = await channel.send(content, allowed_mentions=allowed_mentions)
+            board_editor.remember(message, content)
+            board_messages.append(message)
+        # Fewer pages, the messages left over are deleted
+        while len(board_messages) > len(pages):
+            message = board_messages.pop()
+            board_editor.forget(message.id)
+            await message.delete()
     except discord.errors.HTTPException as e:
         print(f"Error sending/editing message: {e}")
 
-def save_data_to_file(user_id):
-    """Saves the user data to a JSON file."""
-    file_path = os.path.join(DATA_FOLDER, f"{user_id}.json")
-
-    # Convert NumPy arrays to lists for JSON compatibility
-    data_list = user_fourth_line_data[user_id].tolist()
+def save_data_to_file(user_id, new_row):
+    """Queues the newest heartbeat row to be appended to the user's history log."""
+    def write(rows):
+        store.append_heartbeats(user_id, rows)
 
-    with open(file_path, "w") as f:
-        json.dump(data_list, f)
+    write_queue.append(("userdata", user_id), write, np.array([new_row], dtype=RECORD_DTYPE))
 
-def load_data_from_file(user_id):
-    """Loads user data from a JSON file."""
-    file_path = os.path.join(DATA_FOLDER, f"{user_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            data_list = json.load(f)
-        return np.array(data_list)  # Convert back to NumPy array
-    return np.zeros((0, 4))  # Return an empty array if no file exists
+def get_user_history(user_id):
+    """Returns the user's history as a RECORD_DTYPE array view, or None if the user is unknown."""
+    if user_id not in user_fourth_line_data:
+        return None
+    return user_fourth_line_data.get(user_id).view()  # Loaded from storage if it is not in memory
 
-def save_fourth_line_numbers(user_id, fourth_line_numbers):
-    fln_int = [int(x) for x in fourth_line_numbers]  # Convert to integers
-    fln_matrix = np.array(fln_int)  # Convert to NumPy array
+def save_fourth_line_numbers(user_id, session_time, session_packs, timestamp):
 
-    if user_id not in user_fourth_line_data:
-        user_fourth_line_data[user_id] = load_data_from_file(user_id)  # Load previous data
+    history = user_fourth_line_data.get(user_id)  # Load previous data if it is not in memory
 
-    if user_fourth_line_data[user_id].size == 0:
-        user_fourth_line_data[user_id] = np.zeros((1, len(fln_int) + 3))  # Increase size to accommodate timestamp
-        user_fourth_line_data[user_id][0, :-3] = fln_int
-        user_fourth_line_data[user_id][0, -1] = int(time.time())  # Add Unix timestamp
+    if len(history) == 0:
+        time_total, pack_total = 0, 0
     else:
-        previous_row = user_fourth_line_data[user_id][-1]
-        if np.sum(fln_matrix) != 0:
-            time_total = (fln_matrix[0] - previous_row[0]) + previous_row[2]
-            pack_total = (fln_matrix[1] - previous_row[1]) + previous_row[3]
+        # Python ints, the unsigned session fields must not wrap around when a session restarts
+        previous_row = history.last().item()
+        if session_time + session_packs != 0:
+            time_total = (session_time - previous_row[0]) + previous_row[2]
+            pack_total = (session_packs - previous_row[1]) + previous_row[3]
         else:
-            last_col2, last_col3 = find_last_nonzero(user_id)
-            time_total = last_col2 if last_col2 is not None else previous_row[0]
-            pack_total = last_col3 if last_col3 is not None else previous_row[1]
+            last_total_time, last_total_packs = find_last_nonzero(user_id)
+            time_total = last_total_time if last_total_time is not None else previous_row[0]
+            pack_total = last_total_packs if last_total_packs is not None else previous_row[1]
 
-        new_matrix = np.concatenate((fln_matrix, [time_total, pack_total, int(time.time())]), axis=0)  # Add Unix timestamp
-        user_fourth_line_data[user_id] = np.vstack((user_fourth_line_data[user_id], new_matrix))
+    new_row = (session_time, session_packs, time_total, pack_total, timestamp)  # Fields of RECORD_DTYPE
 
-    save_data_to_file(user_id)  # Save data after every update
+    # Queue the write first so the user can't be evicted before the row is stored
+    save_data_to_file(user_id, new_row)  # Only the new row is written
+    user_fourth_line_data.append(user_id, new_row)  # Amortized O(1), the existing history is not copied
 
 def find_last_nonzero(user_id):
-    """Finds the last nonzero elements in column 3 (index 2) and column 4 (index 3)"""
-    data = user_fourth_line_data[user_id]
+    """Finds the last nonzero total time and total packs"""
+    data = get_user_history(user_id)
 
-    # Find the last nonzero element in column 2 (index 1) and column 3 (index 2)
-    col_2_nonzero = np.where(data[:, 2] != 0)[0]  # Indices where column 2 is nonzero
-    col_3_nonzero = np.where(data[:, 3] != 0)[0]  # Indices where column 3 is nonzero
+    total_time_nonzero = np.flatnonzero(data["total_time"])  # Indices where the total time is nonzero
+    total_packs_nonzero = np.flatnonzero(data["total_packs"])  # Indices where the total packs are nonzero
 
-    last_nonzero_col_2 = data[col_2_nonzero[-1], 2] if col_2_nonzero.size > 0 else None
-    last_nonzero_col_3 = data[col_3_nonzero[-1], 3] if col_3_nonzero.size > 0 else None
+    last_total_time = int(data["total_time"][total_time_nonzero[-1]]) if total_time_nonzero.size > 0 else None
+    last_total_packs = int(data["total_packs"][total_packs_nonzero[-1]]) if total_packs_nonzero.size > 0 else None
 
-    return last_nonzero_col_2, last_nonzero_col_3
+    return last_total_time, last_total_packs
 
 def get_max_column_1(user_id):
-    if user_id in user_fourth_line_data:
-        data = user_fourth_line_data[user_id]
+    data = get_user_history(user_id)
+    if data is not None:
         if data.size > 0:  # Ensure data exists
-            max_value = np.max(data[:, 0])  # Get the max value from column 1 (index 0)
+            max_value = np.max(data["time"])  # Longest session time
             return max_value
     return None  # Return None if no data is found
 
 def get_max_column_2(user_id):
-    if user_id in user_fourth_line_data:
-        data = user_fourth_line_data[user_id]
+    data = get_user_history(user_id)
+    if data is not None:
         if data.size > 0:  # Ensure data exists
-            max_value = np.max(data[:, 1])  # Get the max value from column 2 (index 1)
+            max_value = np.max(data["packs"])  # Most packs in a session
             return max_value
     return None  # Return None if no data is found
 
-def load_all_user_data():
-    """Loads all user data from JSON files in the user_data directory."""
-    global user_fourth_line_data
-    for filename in os.listdir(DATA_FOLDER):
-        if filename.endswith(".json"):
-            user_id = filename.replace(".json", "")
-            user_fourth_line_data[user_id] = load_data_from_file(user_id)
+def load_all_user_data(snapshot):
+    """Loads the totals of every user and tester, full histories are loaded when a user is first used."""
+    if not restore_totals(snapshot):
+        user_fourth_line_data.load_summaries(store.user_summaries())
+        tester_summaries.clear()
+        tester_summaries.update(store.tester_summaries())
+        print(f"Read the totals of {len(user_fourth_line_data.summaries)} users and {len(tester_summaries)} testers from storage.")
+    restore_warning_cooldowns(read_cooldowns(WARNING_COOLDOWNS_FILE))
+
+def restore_totals(snapshot):
+    """
+    Loads the user and tester totals saved in the snapshot, only users and testers whose
+    files changed after the snapshot are read from storage. False if storage has to be read in full.
+    """
+    if snapshot is None:
+        return False
+    _, state = snapshot
+    if state.get("storage") != store.name or "summaries" not in state:
+        return False  # Snapshots from before the totals were saved, or of the other backend
+    changed = store.changed_since(state["created"])
+    if changed is None:
+        return False
+    changed_users, changed_testers = changed
+
+    stored_users = store.list_users()
+    summaries = {user_id: tuple(summary) for user_id, summary in state["summaries"].items()
+                 if user_id in stored_users and user_id not in changed_users}
+    read_users = stored_users - summaries.keys()  # Changed, or written while the snapshot was taken
+    for user_id in read_users:
+        summary = store.user_summary(user_id)
+        if summary is not None:
+            summaries[user_id] = summary
+    user_fourth_line_data.load_summaries(summaries)
+
+    stored_testers = store.list_testers()
+    tester_summaries.clear()
+    tester_summaries.update((user_id, summary) for user_id, summary in state["testers"].items()
+                            if user_id in stored_testers and user_id not in changed_testers)
+    read_testers = stored_testers - tester_summaries.keys()
+    for user_id in read_testers:
+        ledger = store.read_tester_ledger(user_id)
+        if ledger is not None:
+            tester_ledgers[user_id] = ledger
+            tester_summaries[user_id] = ledger.summary()
+    print(f"Restored the totals of {len(summaries)} users and {len(tester_summaries)} testers, "
+          f"{len(read_users)} users and {len(read_testers)} testers changed and were read from storage.")
+    return True
+
+def build_snapshot():
+    """Copies the in-memory state, cheap enough to run on the event loop."""
+    histories = {user_id: history.view().copy() for user_id, history in user_fourth_line_data.resident_items()}
+    state = {
+        "created": int(time.time()),
+        "rollers": [status.to_list() for status in user_messages.values()],
+        "baselines": roller_baselines.to_dict(),
+        "last_warning_timestamps": last_warning_timestamps,
+        "board_messages": [message.id for message in board_messages],
+        # Totals without queued writes, restore_totals reads the others and everything written since from storage
+        "storage": store.name,
+        "summaries": {user_id: summary for user_id, summary in user_fourth_line_data.summaries.items()
+                      if not write_queue.is_pending(("userdata", user_id))},
+        "testers": {user_id: summary for user_id, summary in tester_summaries.items()
+                    if not write_queue.is_pending(("testers", user_id))},
+    }
+    return histories, json.loads(json.dumps(state, default=float))  # Detached from the live dicts
+
+def save_snapshot():
+    """Writes the in-memory state to SNAPSHOT_FILE."""
+    histories, state = build_snapshot()
+    write_snapshot(SNAPSHOT_FILE, histories, state)
+
+def restore_snapshot(snapshot):
+    """Loads the state saved by save_snapshot, must run after load_all_user_data."""
+    global restored_board_message_ids
+    if snapshot is None:
+        return False
+    histories, state = snapshot
+
+    restored = 0
+    for user_id, rows in histories.items():
+        # Only trust histories that still end with the newest stored row, storage may have moved on since
+        summary = user_fourth_line_data.summaries.get(user_id)
+        if summary and len(rows) and rows[-1]["ts"] == summary[2] and rows[-1]["total_packs"] == summary[1]:
+            user_fourth_line_data.restore(user_id, rows)
+            restored += 1
+
+    for values in state.get("rollers", []):  # Snapshots from before the roller records only lose the status board
+        status = RollerStatus.from_list(values)
+        user_messages[status.user_id] = status
+        roller_board.update(status)
+        expiry_timer.schedule(("roller", status.user_id), status.timestamp + OFFLINE_TIMER)
+    restore_warning_cooldowns(state["last_warning_timestamps"])
+    roller_baselines.load(state.get("baselines", {}))  # Without them the baselines warm up again
+    # Snapshots from before the paginated board have the id of its only message
+    restored_board_message_ids = state.get("board_messages") or [message_id for message_id in [state.get("latest_sent_message")] if message_id]
+    print(f"Snapshot from {datetime.fromtimestamp(state['created'])} restored ({restored}/{len(histories)} histories).")
+    return True
 
 ################################################################################
 # Bot Events
@@ -259,44 +563,15 @@ async def check(ctx, user_id: str = None):
 
     elif user_id.lower() == "inactive":
         current_time = int(time.time())
-        inactive_users = []
         seven_days_ago = current_time - (7 * 24 * 60 * 60)
 
-        # Get all users from userdata folder
-        all_users = {file.stem for file in DATA_FOLDER.glob("*.json")}
-
-        # Check their last test timestamp in testers folder
-        for user_file in TESTERS_FOLDER.glob("*.json"):
-            user_id = user_file.stem
-
-            # Skip user IDs that contain a hyphen
-            if "-" in user_id:
-                continue
-
-            if user_id in all_users:  # Ensure the user exists in userdata folder
-                with open(user_file, "r") as f:
-                    data = json.load(f)
-                    if data and isinstance(data, list):
-                        last_entry = data[-1]
-                        if last_entry and len(last_entry) > 1:
-                            last_timestamp = last_entry[1]
-                            if last_timestamp < seven_days_ago:
-                                inactive_users.append(f"<@{user_id}>")
-                        else:
-                            inactive_users.append(f"<@{user_id}>")
-                    else:
-                        inactive_users.append(f"<@{user_id}>")
-
-        # Add users who are in userdata but not in testers
-        for user_file in DATA_FOLDER.glob("*.json"):
-            user_id = user_file.stem
-
-            # Skip user IDs that contain a hyphen
+        # Users in userdata whose last test is older than 7 days or who have no tester data
+        inactive_users = []
+        for user_id in user_fourth_line_data.summaries:
             if "-" in user_id:
                 continue
-
-            tester_file = TESTERS_FOLDER / f"{user_id}.json"
-            if not tester_file.exists():
+            last_test = tester_summaries.get(user_id, [0, None])[1]
+            if last_test is None or last_test < seven_days_ago:
                 inactive_users.append(f"<@{user_id}>")
 
         if inactive_users:
@@ -308,19 +583,12 @@ async def check(ctx, user_id: str = None):
         return
 
     elif user_id.lower() == "testers":  # New command to list all tester data
-        tester_files = list(TESTERS_FOLDER.glob("*.json"))
-        if not tester_files:
+        if not tester_summaries:
             await ctx.send("No tester data available.")
             return
 
-        testers_data = []
-        for file in tester_files:
-            tester_id = file.stem  # Extract user ID from filename
-            with open(file, "r") as f:
-                data = json.load(f)
-                # Get the first number in the last entry (reaction_count)
-                reaction_count = data[-1][0] if data else 0
-                testers_data.append((tester_id, reaction_count))
+        # Reaction counts are kept up to date in memory
+        testers_data = [(tester_id, summary[0]) for tester_id, summary in tester_summaries.items()]
 
         # Define grouping ranges
         grouping_ranges = {
@@ -350,19 +618,63 @@ async def check(ctx, user_id: str = None):
         await ctx.send(response, allowed_mentions=discord.AllowedMentions(users=False))
         return
 
+    elif user_id.lower() == "stats":  # Internal counters of the bot
+        persistence = write_queue.stats()
+        response = (f"**Persistence ({store.name} storage):**\n"
+                    f"Queue: {persistence['dirty_keys']} dirty files, {persistence['queued_items']} queued writes\n"
+                    f"Flushes: {persistence['flushes']} ({persistence['items_written']} writes, {persistence['write_errors']} errors)\n"
+                    f"Flush latency: last {persistence['last_flush_ms']:.1f} ms, "
+                    f"avg {persistence['avg_flush_ms']:.1f} ms, max {persistence['max_flush_ms']:.1f} ms")
+        history = user_fourth_line_data.stats()
+        response += (f"\n**History cache:**\n"
+                     f"Users in memory: {history['resident_users']}/{history['known_users']} "
+                     f"({history['resident_bytes'] / 1024 / 1024:.1f} MB)\n"
+                     f"Hits: {history['hits']} Misses: {history['misses']} Evictions: {history['evictions']}")
+        for (_, channel_id), queue in source_queues.items():
+            ingest = queue.stats()
+            response += (f"\n**Heartbeat queue <#{channel_id}>:**\n"
+                         f"Waiting: {ingest['depth']} heartbeats of {ingest['users']} users (high-water {ingest['high_water']})\n"
+                         f"Queued: {ingest['enqueued']} Coalesced: {ingest['coalesced']} "
+                         f"Delayed: {ingest['delayed']} (avg {ingest['avg_delay_ms']:.1f} ms) Dropped: {ingest['dropped']}")
+        response += (f"\n**In memory:**\n"
+                     f"Rollers: {len(user_messages)} Warning cooldowns: {len(last_warning_timestamps)} "
+                     f"Tracked messages: {len(message_reactions)} Expiry deadlines: {len(expiry_timer)} "
+                     f"(expired {expiry_timer.expired})")
+        digest = warning_digest.stats()
+        response += (f"\n**Warnings:**\n"
+                     f"Sent: {digest['warnings_sent']} in {digest['digests']} digests, {digest['pending']} waiting\n"
+                     f"Triggered: {digest['triggered']} Suppressed by cooldown: {digest['suppressed']}\n"
+                     f"Baselines: {len(roller_baselines)} rollers, {roller_baselines.flagged} drops flagged")
+        charts = chart_renderer.stats()
+        response += (f"\n**Charts:**\n"
+                     f"Made: {charts['rendered']} (avg {charts['avg_render_ms']:.0f} ms) In progress: {charts['in_flight']}\n"
+                     f"Turned down: {charts['rejected']} Timed out: {charts['timeouts']} Errors: {charts['errors']}")
+        cached = chart_cache.stats()
+        response += (f"\nCache: {cached['charts']} charts ({cached['bytes'] / 1024 / 1024:.1f} MB), "
+                     f"data generation {cached['generation']}\n"
+                     f"Hits: {cached['hits']} Misses: {cached['misses']} Evictions: {cached['evictions']}")
+        edits = board_editor.stats()
+        response += (f"\n**Status board edits:**\n"
+                     f"Performed: {edits['performed']} Skipped (unchanged): {edits['skipped']} "
+                     f"Deferred (rate limit): {edits['deferred']}")
+        refreshes = board_scheduler.stats()
+        response += (f"\nRefreshes: {refreshes['refreshes']} ({refreshes['idle_refreshes']} without new heartbeats) "
+                     f"for {refreshes['marks']} heartbeats")
+        await ctx.send(response)
+        return
+
     elif user_id.lower() == "all":  # Handle "all" case first
         total_time = 0
         total_packs = 0
 
-        if not user_fourth_line_data:  # Ensure there is data
+        if not user_fourth_line_data.summaries:  # Ensure there is data
             await ctx.send("No data available for the server.")
             return
 
-        for user_data in user_fourth_line_data.values():
-            if user_data.size > 0:
-                last_entry = user_data[-1]  # Get the last row
-                total_time += last_entry[2] if len(last_entry) > 2 else 0
-                total_packs += last_entry[3] if len(last_entry) > 3 else 0
+        # Totals of the last row of every user, kept in memory for all users
+        for user_total_time, user_total_packs, _ in user_fourth_line_data.summaries.values():
+            total_time += user_total_time
+            total_packs += user_total_packs
 
         response = (f"**Server total:**\n"
                     f"**Total time:** {round(total_time)}\n"
@@ -372,32 +684,9 @@ async def check(ctx, user_id: str = None):
 
     elif user_id.lower() == "top":  # Handle "top" case
 
-        top_users = []
-
-        # Read from stored files instead of cached data
-
-        for file in DATA_FOLDER.glob("*.json"):
-
-            uid = file.stem
-
-            with open(file, "r") as f:
-
-                try:
-
-                    data = json.load(f)
-
-                    if data and isinstance(data, list) and len(data[-1]) > 3:
-                        last_packs = data[-1][3]  # Get total packs from last entry
-
-                        top_users.append((uid, last_packs))
-
-                except json.JSONDecodeError:
-
-                    continue  # Skip corrupted JSON files
-
-        # Sort by total packs and get top 20
-
-        top_users = sorted(top_users, key=lambda x: x[1], reverse=True)[:20]
+        # Read from storage instead of cached data
+        await asyncio.to_thread(write_queue.flush)  # Make sure queued heartbeats are stored
+        top_users = await asyncio.to_thread(store.top_users, 20)
 
         if not top_users:
 
@@ -420,12 +709,12 @@ async def check(ctx, user_id: str = None):
 
     # Check for normal user data
     if user_id in user_fourth_line_data:
-        data = user_fourth_line_data[user_id]
-        last_entry = data[-1] if data.size > 0 else []
-        last_col_1 = last_entry[0] if len(last_entry) > 0 else 0
-        last_col_2 = last_entry[1] if len(last_entry) > 1 else 0
-        last_col_3 = last_entry[2] if len(last_entry) > 2 else 0
-        last_col_4 = last_entry[3] if len(last_entry) > 3 else 0
+        data = get_user_history(user_id)
+        last_entry = data[-1] if data.size > 0 else np.zeros((), dtype=RECORD_DTYPE)
+        last_col_1 = last_entry["time"]
+        last_col_2 = last_entry["packs"]
+        last_col_3 = last_entry["total_time"]
+        last_col_4 = last_entry["total_packs"]
         max_value_1 = get_max_column_1(user_id)
         max_value_2 = get_max_column_2(user_id)
 
@@ -437,67 +726,61 @@ async def check(ctx, user_id: str = None):
         response = f"No data found for User ID: {user_id}\n"
 
     # Check for tester data
-    tester_file = TESTERS_FOLDER / f"{user_id}.json"
-    if tester_file.exists():
-        with open(tester_file, "r") as f:
-            tester_data = json.load(f)
-            # Get the first number in the last entry (reaction_count)
-            reaction_count = tester_data[-1][0] if tester_data else 0
-            response += f"**Tester data:**\nPack tests: {reaction_count}"
+    if user_id in tester_summaries:
+        response += f"**Tester data:**\nPack tests: {tester_summaries[user_id][0]}"
 
     await ctx.send(response, allowed_mentions=discord.AllowedMentions(users=False))
 
 @bot.command(name="pokechart")
 async def pokechart(ctx, chart_type: str = "line", user_id: str = None):
-
-    # Load user data
-    users_df = pd.read_csv(USERNAMES_DIRECTORY)
-    users_dict = dict(zip(users_df["Discord_ID"].astype(str), users_df["IGN"]))
+    chart_type = chart_type.lower()
+    if chart_type not in CHART_TYPES:
+        await ctx.send("Invalid chart type. Available types: line, histogram, pie, boxplot, density.")
+        return
 
     # Determine user ID
     user_id_base = str(ctx.author.id) if user_id is None else "".join(filter(str.isdigit, user_id))
 
-    # Find all related IDs (main + alts)
-    related_ids = [file.stem for file in Path(DATA_FOLDER).glob("*.json") if file.stem.startswith(user_id_base)]
+    # Find all related IDs (main + alts), the in-memory totals include users whose rows are still queued
+    related_ids = [uid for uid in user_fourth_line_data.summaries if uid.startswith(user_id_base)]
 
-    # Combine all related user data into a single dataset
-    combined_data = []
-    for uid in related_ids:
-        file_path = os.path.join(DATA_FOLDER, f"{uid}.json")
-        if os.path.exists(file_path):
-            combined_data.extend(read_json_data(file_path))
-
-    if not combined_data:
+    # The charts read the recent data themselves, only check that the user has any
+    if not related_ids:
         await ctx.send(f"No data found for User ID `{user_id_base}`.")
         return
 
-    segments = extract_segments(combined_data)
-    plt.switch_backend('Agg')
-
-    # Generate the specified chart
-    chart_name = "chart.png"
-    if chart_type.lower() == "line":
-        plot_line(DATA_FOLDER, user_id_base, users_dict)  # Pass DATA_FOLDER instead of segments
-    elif chart_type.lower() == "histogram":
-        plot_histogram(DATA_FOLDER, user_id_base, users_dict)
-    elif chart_type.lower() == "pie":
-        plot_pie(DATA_FOLDER, users_dict)
-    elif chart_type.lower() == "boxplot":
-        plot_boxplot(DATA_FOLDER, users_dict)
-    elif chart_type.lower() == "density":
-        plot_density(DATA_FOLDER)
+    # Line and histogram only show the user and their alts, the other charts show everyone.
+    # The generation is taken before anything is awaited, heartbeats arriving meanwhile can only make the chart newer
+    if chart_type in ("line", "histogram"):
+        generation = tuple((uid, chart_cache.user_generation(uid)) for uid in sorted(related_ids))
     else:
-        await ctx.send("Invalid chart type. Available types: line, histogram, pie, boxplot, density.")
+        generation = chart_cache.generation
+    cache_key = (chart_type, user_id_base if chart_type in ("line", "histogram") else None,
+                 int(time.time()) // CHART_CACHE_WINDOW, generation)
+
+    # The same chart of the same data was made already
+    png = chart_cache.get(cache_key)
+    if png is not None:
+        await ctx.send(file=discord.File(io.BytesIO(png), filename="chart.png"))
         return
 
-    plt.savefig(chart_name)
-    plt.close()
-
-    with open(chart_name, "rb") as f:
-        picture = discord.File(f)
-        await ctx.send(file=picture)
+    # Generate the specified chart in a worker process
+    try:
+        await asyncio.to_thread(write_queue.flush)  # Charts read the history files directly
+        png = await chart_renderer.render(chart_type, user_id_base)
+        chart_cache.put(cache_key, png)
+    except ChartQueueFull:
+        await ctx.send("Too many charts are being made right now, please try again in a minute.")
+        return
+    except asyncio.TimeoutError:
+        await ctx.send(f"The chart took longer than {CHART_TIMEOUT} seconds and was given up.")
+        return
+    except Exception as e:
+        print(f"Error making {chart_type} chart: {e}")
+        await ctx.send("Error making the chart.")
+        return
 
-    os.remove(chart_name)
+    await ctx.send(file=discord.File(io.BytesIO(png), filename="chart.png"))
 
 @bot.command(name="mythreads")
 async def my_threads(ctx):
@@ -591,9 +874,10 @@ async def my_threads(ctx):
 @commands.has_any_role(*MODERATOR_ROLE)  # Restrict command to users with the specified roles
 async def retire_user(ctx, user_id: str):
     """
-    Moves a user's JSON file from the userdata folder to the delete_userdata folder,
+    Moves a user's history files from the userdata folder to the delete_userdata folder,
     and moves the corresponding file from the testers folder to the deleted_testers folder.
     If a file already exists in the destination folders, it will be replaced.
+    With the SQLite backend the rows are moved to the deleted tables instead.
     Only users with specific roles can use this command.
     """
     # Ensure the user_id is a valid numeric string
@@ -602,100 +886,68 @@ async def retire_user(ctx, user_id: str):
         await ctx.send("Invalid user ID. Please provide a valid numeric user ID.")
         return
 
-    # Define the source and destination paths for userdata
-    source_userdata_path = DATA_FOLDER / f"{user_id}.json"
-    destination_userdata_path = DELETE_USERDATA_FOLDER / f"{user_id}.json"
-
-    # Define the source and destination paths for testers
-    source_testers_path = TESTERS_FOLDER / f"{user_id}.json"
-    destination_testers_path = DELETED_TESTERS_FOLDER / f"{user_id}.json"
-
-    # Check if the file exists in the userdata folder
-    if not source_userdata_path.exists():
-        await ctx.send(f"No data found for User ID: {user_id} in the userdata folder.")
-
-    # If the file already exists in the delete_userdata folder, remove it
-    if destination_userdata_path.exists():
-        try:
-            destination_userdata_path.unlink()  # Delete the existing file
-        except Exception as e:
-            await ctx.send(f"Failed to remove existing file in deleted_userdata folder: {e}")
-
-
-    # Move the userdata file
-    try:
-        source_userdata_path.rename(destination_userdata_path)
-        await ctx.send(f"User data for <@{user_id}> has been retired and moved to the deleted_userdata folder.")
-    except Exception as e:
-        await ctx.send(f"An error occurred while moving the userdata file: {e}")
-
-
-    # Check if the file exists in the testers folder
-    if source_testers_path.exists():
-        # If the file already exists in the deleted_testers folder, remove it
-        if destination_testers_path.exists():
-            try:
-                destination_testers_path.unlink()  # Delete the existing file
-            except Exception as e:
-                await ctx.send(f"Failed to remove existing file in deleted_testers folder: {e}")
+    # Write out anything still queued for this user before the files are moved
+    await asyncio.to_thread(write_queue.flush)
+    user_fourth_line_data.pop(user_id)  # Stop appending to the retired history
+    tester_ledgers.pop(user_id, None)
+    tester_summaries.pop(user_id, None)
+    chart_cache.bump(user_id)  # Charts with the user in them are out of date
 
-        # Move the testers file
-        try:
-            source_testers_path.rename(destination_testers_path)
-            await ctx.send(f"Tester data for <@{user_id}> has been retired and moved to the deleted_testers folder.")
-        except Exception as e:
-            await ctx.send(f"An error occurred while moving the testers file: {e}")
-    else:
-        await ctx.send(f"No tester data found for User ID: {user_id} in the testers folder.")
+    # Move the userdata and tester data and report every step
+    for response in await asyncio.to_thread(store.retire_user, user_id):
+        await ctx.send(response)
 
 @bot.event
 async def on_ready():
-    global latest_sent_message
     print(f'Logged in as {bot.user} (ID: {bot.user.id})')
 
-    load_all_user_data()  # Load saved data at startup
-    print("User data loaded successfully.")
+    global state_loaded
+    if not state_loaded:  # Reconnects fire on_ready again, the state is already in memory then
+        snapshot = read_snapshot(SNAPSHOT_FILE)
+        load_all_user_data(snapshot)  # Load saved data at startup
+        restore_snapshot(snapshot)
+        state_loaded = True
+        print("User data loaded successfully.")
+        await backfill_heartbeats()
+        # Everything the backfill queued is written with one flush per user
+        await asyncio.to_thread(write_queue.flush)
+        start_heartbeat_workers()  # Then the heartbeats that arrived during the backfill
+        expiry_timer.expire_due()  # Rollers that went offline while the bot was down leave before the first board
+    write_queue.start()
 
     await bot.wait_until_ready()
 
     channel = await get_channel(DESTINATION_CHANNEL_ID)
-    if channel and latest_sent_message is None:
-        latest_sent_message = await channel.send("Initializing...", allowed_mentions=allowed_mentions)
-
-    if not send_message_list_task.is_running():
-        send_message_list_task.start()
+    if channel and not board_messages:
+        # Keep editing the status messages from before the restart, pages that are gone are posted again
+        for message_id in restored_board_message_ids:
+            try:
+                board_messages.append(await channel.fetch_message(message_id))
+            except discord.HTTPException:
+                break
+        if not board_messages:
+            board_messages.append(await channel.send("Initializing...", allowed_mentions=allowed_mentions))
+
+    global board_refresh_task, expiry_task, warning_task
+    if expiry_task is None:
+        expiry_task = asyncio.create_task(expiry_timer.run())
+    if warning_task is None:
+        warning_task = asyncio.create_task(warning_scheduler.run())
+    if board_refresh_task is None:
+        board_refresh_task = asyncio.create_task(board_scheduler.run())
+    if not save_snapshot_task.is_running():
+        save_snapshot_task.start()
+    if not compaction_task.is_running():
+        compaction_task.start()
 
 @bot.event
 async def on_message(message):
-    if message.author.id == TARGET_USER_ID and message.channel.id == SOURCE_CHANNEL_ID:
-        lines = message.content.split("\n")
-        if len(lines) < 4:
-            return
-
-        match = re.search(r'<(\d+(?:-\d+)?)>', lines[0].strip())
-        user_id = match.group(1) if match else None
-        user_id_display = user_id.split('-')[0] if user_id else None
-        timestamp_formatted = f"<t:{int(message.created_at.timestamp())}:R>"
-        second_line_numbers = len(re.findall(r'\d+', lines[1].strip()))
-        third_line_numbers = len(re.findall(r'\d+', lines[2].strip()))
-        fourth_line_numbers = re.findall(r'\d+', lines[3].strip())
-        pph = (int(fourth_line_numbers[1]) / int(fourth_line_numbers[0]) * 60 if len(fourth_line_numbers) >= 2 and int(fourth_line_numbers[0]) != 0 else 0)
-        time_user = int(fourth_line_numbers[0])
-        # Save the fourth line numbers for the user
-        save_fourth_line_numbers(user_id, fourth_line_numbers)
-        tot_instances = third_line_numbers + second_line_numbers
-
-        if user_id in [data["content"] for data in user_messages.values()]:
-            for key, data in user_messages.items():
-                if data["content"] == user_id:
-                    user_messages[key] = {"content": user_id, "timestamp": timestamp_formatted, "second_line_numbers": second_line_numbers, "pph": pph, "time_user": time_user, "tot_instances": tot_instances}
-                    break
-        else:
-            user_messages[message.id] = {"content": user_id, "timestamp": timestamp_formatted, "second_line_numbers": second_line_numbers, "pph": pph, "time_user": time_user, "tot_instances": tot_instances}
-
-        # Send PPH warning only if second_line_numbers is 40 or more
-        if int(fourth_line_numbers[0]) >= 40 and pph < PPH_WARNING_LIMIT:
-            await send_pph_warning(user_id, pph)
+    source = (message.author.id, message.channel.id)
+    if source in HEARTBEAT_SOURCES:
+        heartbeat = parse_heartbeat(message.content, int(message.created_at.timestamp()))
+        if heartbeat is not None:  # Not a complete heartbeat otherwise
+            if not await get_source_queue(source).put(heartbeat.user_id, (heartbeat, message.id)):
+                print(f"Heartbeat queue of channel {source[1]} is full, dropped a heartbeat of <@{heartbeat.user_id}>")
 
     await bot.process_commands(message)
 
@@ -725,29 +977,14 @@ async def on_reaction_add(reaction, user):
     # Initialize message reactions tracking if not already done
     if reaction.message.id not in message_reactions:
         message_reactions[reaction.message.id] = set()
+        expiry_timer.schedule(("reactions", reaction.message.id), time.time() + REACTION_TRACKING_TTL)
 
     # Add the user to the tracked reactions for this message
     message_reactions[reaction.message.id].add(user.id)
 
-    # Load existing reactions for the message author
+    # Add the reaction to the message author's tester data, written to disk in the background
     message_author_id = str(reaction.message.author.id)
-    file_path = TESTERS_FOLDER / f"{message_author_id}.json"
-    if file_path.exists():
-        with open(file_path, "r") as f:
-            data = json.load(f)
-    else:
-        data = []
-
-    # If the reaction doesn't exist, add it to the JSON file
-    reaction_number = len(data) + 1  # Increment reaction number
-    timestamp = int(time.time())  # Current Unix timestamp
-    new_entry = [reaction_number, timestamp, str(user.id)]  # New row
-
-    data.append(new_entry)
-
-    # Save the updated data back to the JSON file
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
+    increment_reaction_count(message_author_id, user.id)
 
     # Add a success reaction to the message
     try:
@@ -775,29 +1012,18 @@ async def on_reaction_remove(reaction, user):
 
     # Load existing reactions for the message author
     message_author_id = str(reaction.message.author.id)
-    file_path = TESTERS_FOLDER / f"{message_author_id}.json"
-    if not file_path.exists():
+    if message_author_id not in tester_summaries:
         return
+    ledger = get_tester_ledger(message_author_id)
 
-    with open(file_path, "r") as f:
-        data = json.load(f)
-
-    # Find the last entry for the user who removed the reaction
-    entry_to_remove = None
-    for entry in reversed(data):  # Iterate in reverse to find the most recent entry
-        if entry[2] == str(user.id):  # Check if the reactor ID matches
-            entry_to_remove = entry
-            break
-
-    if entry_to_remove:
-        data.remove(entry_to_remove)
-    else:
+    # Remove the most recent entry of the user who removed the reaction
+    entry_to_remove = ledger.remove_latest(user.id)
+    if entry_to_remove is None:
         return
+    tester_summaries[message_author_id] = ledger.summary()
 
-    # Save the updated data back to the JSON file
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
-
+    # Save the removal
+    save_tester_op(message_author_id, "remove", entry_to_remove)
 
     # Remove the SUCCESS_EMOJI from the message
     try:
@@ -813,8 +1039,32 @@ async def retire_user_error(ctx, error):
     else:
         await ctx.send(f"An error occurred: {error}")
 
-@tasks.loop(seconds=EDIT_LOOP_TIMER)
-async def send_message_list_task():
-    await send_message_list()
+@tasks.loop(hours=COMPACTION_INTERVAL_HOURS)
+async def compaction_task():
+    raw_cutoff, hourly_cutoff = tier_cutoffs(time.time(), RAW_RETENTION_DAYS, HOURLY_RETENTION_DAYS)
+    try:
+        removed = await asyncio.to_thread(store.compact, raw_cutoff, hourly_cutoff)
+        print(f"History compaction removed {removed} rows.")
+    except Exception as e:
+        print(f"Error compacting history: {e}")
+    print(f"Queued compaction of {compact_tester_ledgers()} tester ledgers.")
 
-bot.run(YOUR_BOT_TOKEN)
\ No newline at end of file
+@tasks.loop(seconds=SNAPSHOT_INTERVAL)
+async def save_snapshot_task():
+    histories, state = build_snapshot()
+    try:
+        await asyncio.to_thread(write_snapshot, SNAPSHOT_FILE, histories, state)
+    except OSError as e:
+        print(f"Error writing snapshot: {e}")
+
+if __name__ == "__main__":  # replay.py imports the bot without connecting to Discord
+    if not YOUR_BOT_TOKEN:
+        raise ValueError("Bot token not found. Please set DISCORD_BOT_TOKEN in .env file.")
+    try:
+        bot.run(YOUR_BOT_TOKEN)
+    finally:
+        chart_renderer.shutdown()
+        write_queue.stop()  # Flush pending userdata and tester writes before exiting
+        if state_loaded:  # Don't overwrite the last snapshot with an empty state
+            save_snapshot()
+        store.close()
\ No newline at end of file
@@ -0,0 +1,67 @@
+import json
+import re
+import sys
+import time
+
+from heartbeat_parser import parse_heartbeat
+
+################################################################################
+# Heartbeat parser micro-benchmark
+#
+#     python bench_parser.py [corpus.jsonl] [rounds]
+#
+# The corpus has one {"content": ..., "created_at": unix_ts} object per line, like
+# heartbeat_corpus.jsonl. Every round parses the whole corpus, the best round is
+# reported so the numbers do not depend on what else the machine is doing.
+################################################################################
+DEFAULT_CORPUS = "heartbeat_corpus.jsonl"
+DEFAULT_ROUNDS = 50
+
+
+def parse_inline(content, timestamp):
+    """The parsing on_message did before heartbeat_parser, kept as the baseline."""
+    lines = content.split("\n")
+    if len(lines) < 4:
+        return None
+    match = re.search(r'<(\d+(?:-\d+)?)>', lines[0].strip())
+    user_id = match.group(1) if match else None
+    second_line_numbers = len(re.findall(r'\d+', lines[1].strip()))
+    third_line_numbers = len(re.findall(r'\d+', lines[2].strip()))
+    fourth_line_numbers = re.findall(r'\d+', lines[3].strip())
+    pph = (int(fourth_line_numbers[1]) / int(fourth_line_numbers[0]) * 60 if len(fourth_line_numbers) >= 2 and int(fourth_line_numbers[0]) != 0 else 0)
+    time_user = int(fourth_line_numbers[0])
+    return user_id, second_line_numbers, third_line_numbers + second_line_numbers, time_user, pph, timestamp
+
+
+def load_corpus(path):
+    with open(path, "r") as f:
+        return [(record["content"], record["created_at"]) for record in map(json.loads, f) if record]
+
+
+def bench(parse, corpus, rounds):
+    """Best time of one pass over the corpus, in seconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for content, timestamp in corpus:
+            parse(content, timestamp)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CORPUS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS
+    corpus = load_corpus(corpus_path)
+    parsed = sum(parse_heartbeat(content, timestamp) is not None for content, timestamp in corpus)
+    print(f"{len(corpus)} messages from {corpus_path}, {parsed} complete heartbeats, best of {rounds} rounds")
+
+    # The inline parser raises on cut off heartbeats, it only gets the messages it can handle
+    complete = [(content, timestamp) for content, timestamp in corpus if parse_heartbeat(content, timestamp)]
+    for name, parse, messages in (("parse_heartbeat", parse_heartbeat, corpus), ("inline (before)", parse_inline, complete)):
+        seconds = bench(parse, messages, rounds)
+        print(f"{name:>16}: {seconds / len(messages) * 1e6:.2f} µs/message, {len(messages) / seconds:,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import re
+import time
+
+import aiohttp
+
+# PATCH /channels/{channel_id}/messages/{message_id}, the route of a message edit
+EDIT_ROUTE = re.compile(r"/channels/(\d+)/messages/\d+$")
+
+
+def paginate(header, lines, limit):
+    """Splits the board over pages of at most limit characters, only between lines. header starts the first page."""
+    pages, page, size = [], [], len(header)
+    for line in lines:
+        if page and size + len(line) + 1 > limit:  # One more character for the newline
+            pages.append(page)
+            page, size = [], 0
+        page.append(line)
+        size += len(line) + 1
+    pages.append(page)
+    return [header + "\n".join(pages[0])] + ["\n".join(page) for page in pages[1:]]
+
+
+def _digest(content):
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+class BoardEditor:
+    """
+    Edits the status board messages only when their content changed and Discord allows it.
+
+    The digest of the content last written to every message is kept, an edit with the same
+    content is skipped. trace_config() reads Discord's rate limit headers of every message
+    edit, when a channel's bucket is used up the edits in it wait until it resets instead
+    of queueing behind the rate limit and using up the budget the warnings and replies need.
+    """
+
+    def __init__(self):
+        self._digests = {}  # message id -> digest of the content it shows
+        self._next_edit = {}  # channel id -> time.monotonic() when its edit bucket resets
+
+        # Counters
+        self.performed = 0
+        self.skipped = 0  # Edits with unchanged content
+        self.deferred = 0  # Edits put off by the rate limit
+
+    def remember(self, message, content):
+        """Records the content of a message the bot just sent."""
+        self._digests[message.id] = _digest(content)
+
+    def forget(self, message_id):
+        self._digests.pop(message_id, None)
+
+    async def edit(self, message, content):
+        """Edits the message if needed and allowed, returns True if it was edited."""
+        digest = _digest(content)
+        if self._digests.get(message.id) == digest:
+            self.skipped += 1
+            return False
+        if time.monotonic() < self._next_edit.get(message.channel.id, 0):
+            self.deferred += 1  # The content is still different next time, so it is edited then
+            return False
+        await message.edit(content=content)
+        self._digests[message.id] = digest
+        self.performed += 1
+        return True
+
+    def trace_config(self):
+        """aiohttp TraceConfig for the bot's http_trace, it reads the rate limit headers of message edits."""
+        async def on_request_end(session, context, params):
+            match = EDIT_ROUTE.search(params.url.path)
+            if params.method != "PATCH" or match is None:
+                return
+            headers = params.response.headers
+            if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset-After" in headers:
+                self._next_edit[int(match.group(1))] = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def stats(self):
+        return {"performed": self.performed, "skipped": self.skipped, "deferred": self.deferred}
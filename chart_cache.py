@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+
+class ChartCache:
+    """
+    Keeps recently made charts as PNG bytes, least recently used dropped first.
+
+    Keys include the data generation the chart was made from. bump(user_id) is called
+    when a user's heartbeats change, which moves generation and the user's own
+    user_generation on, so charts of older data are no longer asked for and age out.
+    At most max_entries charts and max_bytes of PNG data are kept.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._charts = OrderedDict()  # key -> PNG bytes, oldest use first
+        self._bytes = 0
+        self.generation = 0  # Changes whenever any heartbeat data changes
+        self._user_generations = {}  # user_id -> generation of the user's last change
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._charts)
+
+    def bump(self, user_id):
+        self.generation += 1
+        self._user_generations[user_id] = self.generation
+
+    def user_generation(self, user_id):
+        return self._user_generations.get(user_id, 0)
+
+    def get(self, key):
+        png = self._charts.get(key)
+        if png is None:
+            self.misses += 1
+            return None
+        self._charts.move_to_end(key)
+        self.hits += 1
+        return png
+
+    def put(self, key, png):
+        old = self._charts.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._charts[key] = png
+        self._bytes += len(png)
+        while self._charts and (len(self._charts) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._charts.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "charts": len(self._charts),
+            "bytes": self._bytes,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
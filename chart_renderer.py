@@ -0,0 +1,134 @@
+import asyncio
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+CHART_TYPES = ("line", "histogram", "pie", "boxplot", "density")
+
+_store = None  # Storage backend of a worker process, opened by its first chart
+
+
+class ChartQueueFull(Exception):
+    """Raised by ChartRenderer.render when max_queued charts are already waiting or being made."""
+
+
+def render_chart(chart_type, user_id, store_args, usernames_path):
+    """Makes a chart in a worker process and returns it as PNG bytes."""
+    global _store
+    # Imported here, the bot process never loads matplotlib, seaborn and pandas for the charts
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    from chartmaker_2_2 import plot_line, plot_histogram, plot_pie, plot_boxplot, plot_density
+    from storage import open_store
+
+    if _store is None:
+        _store = open_store(*store_args[0], **store_args[1])
+
+    # Load user data
+    users_df = pd.read_csv(usernames_path)
+    users_dict = dict(zip(users_df["Discord_ID"].astype(str), users_df["IGN"]))
+
+    if chart_type == "line":
+        plot_line(_store, user_id, users_dict)
+    elif chart_type == "histogram":
+        plot_histogram(_store, user_id, users_dict)
+    elif chart_type == "pie":
+        plot_pie(_store, users_dict)
+    elif chart_type == "boxplot":
+        plot_boxplot(_store, users_dict)
+    elif chart_type == "density":
+        plot_density(_store)
+    else:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format="png")
+    plt.close("all")
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """
+    Makes charts in a pool of worker processes so the bot keeps running meanwhile.
+
+    At most max_queued charts wait or are being made at once, render() raises
+    ChartQueueFull beyond that. A chart that takes longer than timeout seconds raises
+    asyncio.TimeoutError, it is cancelled if it has not started yet, otherwise it keeps
+    counting towards max_queued until its worker is done. The workers are started on the
+    first chart and open the storage backend with open_store(*store_args). A pool whose
+    worker died (killed while making a chart) is dropped and the next chart starts a new one.
+    """
+
+    def __init__(self, store_args, usernames_path, max_workers=2, max_queued=8, timeout=60):
+        self.store_args = store_args  # ((positional args), {keyword args}) of open_store
+        self.usernames_path = usernames_path
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._pool = None
+        self._in_flight = 0
+        self._lock = threading.Lock()  # Charts finish on the pool's management thread
+
+        # Counters
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_render_time = 0.0
+
+    async def render(self, chart_type, user_id):
+        """PNG bytes of the chart."""
+        if self._in_flight >= self.max_queued:
+            self.rejected += 1
+            raise ChartQueueFull()
+        if self._pool is None:
+            # Spawned, a forked copy of the bot would carry its threads and open connections along
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+        pool = self._pool
+        start = time.monotonic()
+        try:
+            future = pool.submit(render_chart, chart_type, user_id, self.store_args, self.usernames_path)
+            with self._lock:
+                self._in_flight += 1
+            future.add_done_callback(self._finished)  # Not on timeout, the worker may still be making the chart
+            png = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except BrokenProcessPool:
+            self.errors += 1
+            if self._pool is pool:  # Another chart may have replaced it already
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        self.rendered += 1
+        self.total_render_time += time.monotonic() - start
+        return png
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        return {
+            "in_flight": self._in_flight,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "avg_render_ms": self.total_render_time / self.rendered * 1000 if self.rendered else 0.0,
+        }
@@ -1,38 +1,29 @@
-import json
 import matplotlib.pyplot as plt
-import os
 import numpy as np
 import seaborn as sns
 from datetime import datetime, timedelta
+from heartbeat_log import list_users, read_rows, empty_rows
 
 time_back = 7 # Days back to show on plots.
 
-def read_json_data(file_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    return data
-
 def filter_recent_entries(json_directory):
     """
-    Filters all JSON files in a directory to only include data from the last 7 days.
-    Returns a dictionary where keys are user IDs (from filenames) and values are lists of filtered entries.
+    Filters all user histories in a directory to only include data from the last 7 days.
+    json_directory can also be a storage backend (storage.FileStore or sqlite_store.SQLiteStore).
+    Returns a dictionary where keys are user IDs (from filenames) and values are record arrays of filtered entries.
     """
     seven_days_ago = datetime.utcnow().timestamp() - (time_back * 24 * 60 * 60)
-    filtered_data = {}
-
-    for file in os.listdir(json_directory):
-        if file.endswith(".json"):
-            user_id = os.path.splitext(file)[0]  # Extract user ID from filename
-            file_path = os.path.join(json_directory, file)
+    if hasattr(json_directory, "recent_heartbeats"):
+        return json_directory.recent_heartbeats(seven_days_ago)
 
-            with open(file_path, "r") as f:
-                data = json.load(f)
+    filtered_data = {}
 
-            # Keep only entries from the last 7 days
-            recent_entries = [entry for entry in data if entry[-1] >= seven_days_ago]
+    for user_id in list_users(json_directory):
+        # Keep only entries from the last 7 days, older partitions are not read
+        recent_entries = read_rows(json_directory, user_id, since=seven_days_ago)
 
-            if recent_entries:
-                filtered_data[user_id] = recent_entries
+        if len(recent_entries):
+            filtered_data[user_id] = recent_entries
 
     return filtered_data
 
@@ -41,7 +32,7 @@ def extract_segments(data):
     current_segment = []
     start_new_segment = True
 
-    for row in data:
+    for row in zip(data["time"].tolist(), data["packs"].tolist()):
         if row[0] == 0.0 and row[1] == 0.0:
             if start_new_segment:
                 current_segment = [(0.0, 0.0)]
@@ -69,9 +60,9 @@ def calculate_derivative(segment):
 
 def plot_line(json_directory, file_name, users_dict):
     """Plots rerolling runs as a line graph with only recent data."""
-    recent_data = filter_recent_entries(json_directory).get(file_name, [])
+    recent_data = filter_recent_entries(json_directory).get(file_name, empty_rows())
 
-    if not recent_data:
+    if not len(recent_data):
         print(f"No recent data for {file_name}.")
         return
 
@@ -91,9 +82,9 @@ def plot_line(json_directory, file_name, users_dict):
 
 def plot_histogram(json_directory, file_name, users_dict):
     """Plots a histogram of packs per hour with only recent data."""
-    recent_data = filter_recent_entries(json_directory).get(file_name, [])
+    recent_data = filter_recent_entries(json_directory).get(file_name, empty_rows())
 
-    if not recent_data:
+    if not len(recent_data):
         print(f"No recent data for {file_name}.")
         return
 
@@ -122,7 +113,7 @@ def plot_pie(json_directory, users_dict):
         print("No recent data found.")
         return
 
-    player_packs = {user_id: sum(row[3] for row in data if row[3] > 0) for user_id, data in recent_data.items()}
+    player_packs = {user_id: int(data["total_packs"][data["total_packs"] > 0].sum()) for user_id, data in recent_data.items()}
     player_packs = {users_dict.get(pid, f"Unknown ({pid})"): packs for pid, packs in player_packs.items() if packs > 0}
 
     if not player_packs:
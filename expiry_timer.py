@@ -0,0 +1,72 @@
+import asyncio
+import heapq
+import time
+from itertools import count
+
+
+class ExpiryTimer:
+    """
+    Calls on_expire(key) when the deadline of a key has passed.
+
+    Deadlines are kept in a heap. Scheduling a key again replaces its deadline, the old
+    heap entry is skipped when it comes up and the heap is rebuilt once most of it is
+    such leftovers, so memory follows the number of scheduled keys. run() sleeps until
+    the earliest deadline and wakes up early when an earlier one is scheduled.
+    """
+
+    def __init__(self, on_expire, clock=time.time):
+        self.on_expire = on_expire
+        self.clock = clock
+        self._heap = []  # (deadline, seq, key), earliest first
+        self._deadlines = {}  # key -> current deadline
+        self._seq = count()  # Keys are never compared, they don't have to be orderable
+        self._wakeup = asyncio.Event()
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, deadline):
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(when, next(self._seq), scheduled) for scheduled, when in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        if self._heap[0][0] == deadline:
+            self._wakeup.set()  # Earlier than what run() is waiting for
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self):
+        """Earliest deadline, None if nothing is scheduled."""
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)  # Rescheduled or cancelled
+        return heap[0][0] if heap else None
+
+    def expire_due(self):
+        """Calls on_expire for every key whose deadline has passed, returns how many there were."""
+        now = self.clock()
+        expired = 0
+        while (deadline := self.next_deadline()) is not None and deadline <= now:
+            _, _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            expired += 1
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                print(f"Error expiring {key}: {e}")
+        self.expired += expired
+        return expired
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            self.expire_due()
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max(deadline - self.clock(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
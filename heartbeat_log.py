@@ -0,0 +1,385 @@
+import json
+import os
+import shutil
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from rollup import TIERS, rollup_rows
+
+################################################################################
+# Append-only, time-partitioned heartbeat log
+#
+# Every user gets a "<user_id>/" folder with one file of fixed-width binary records
+# per week and a manifest listing the time range of every partition:
+#     userdata/<user_id>/manifest.json
+#     userdata/<user_id>/2026-10-12.hb   (rows with a timestamp in the week starting that Monday, UTC)
+# One record is one heartbeat row of RECORD_DTYPE: (time, packs, total_time, total_packs, ts)
+# A heartbeat only appends one record, so the write cost does not depend on how much
+# history the user already has, and reading a time window only opens the partitions
+# that overlap it. Old "<user_id>.hb" and "<user_id>.json" files are still read and
+# are split into partitions the first time the user is written to.
+# Each partition has a tier in the manifest. Partitions start as "raw" and
+# compact_user later rolls old ones up to "hourly" and then "daily" rows (see rollup.py).
+#
+# Every partition file starts with a header (magic, format version, record size) padded
+# to one record, followed by the packed records, so a file is loaded straight into a
+# RECORD_DTYPE array without any parsing. Files of format version 1 have no header and
+# store every row as five float64 values; they are still read and are converted the
+# next time they are written to.
+################################################################################
+LOG_SUFFIX = ".hb"
+LEGACY_SUFFIX = ".json"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+FORMAT_VERSION = 2
+RECORD_DTYPE = np.dtype([
+    ("time", "<u4"),  # Session minutes
+    ("packs", "<u4"),  # Session packs
+    ("total_time", "<i8"),  # Signed, totals are built from differences between heartbeats
+    ("total_packs", "<i8"),
+    ("ts", "<i8"),  # Unix timestamp
+])
+FIELDS = RECORD_DTYPE.names
+ROW_WIDTH = len(FIELDS)
+RECORD_SIZE = RECORD_DTYPE.itemsize
+FILE_MAGIC = b"HBLOG\n"
+HEADER = struct.Struct("<6sHHH")  # Magic, format version, record size, number of fields
+HEADER_SIZE = RECORD_SIZE  # Padded to one record
+V1_DTYPE = np.dtype("<f8")  # Format version 1: ROW_WIDTH float64 values per row, no header
+PARTITION_SECONDS = 7 * 24 * 60 * 60  # One partition per week
+PARTITION_ALIGN = 4 * 24 * 60 * 60  # The Unix epoch is a Thursday, partitions start on Mondays
+
+
+def user_folder(folder, user_id):
+    return Path(folder) / str(user_id)
+
+
+def flat_log_path(folder, user_id):
+    """Single-file log used before the history was partitioned."""
+    return Path(folder) / f"{user_id}{LOG_SUFFIX}"
+
+
+def legacy_path(folder, user_id):
+    return Path(folder) / f"{user_id}{LEGACY_SUFFIX}"
+
+
+def empty_rows():
+    return np.zeros(0, dtype=RECORD_DTYPE)
+
+
+def partition_start(timestamp):
+    """Start of the week partition that holds the timestamp."""
+    return int((timestamp - PARTITION_ALIGN) // PARTITION_SECONDS * PARTITION_SECONDS + PARTITION_ALIGN)
+
+
+def partition_name(start):
+    return datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def to_records(rows):
+    """Turns records, a record, a (n, 5) array or a list of rows into a RECORD_DTYPE array."""
+    rows = np.asarray(rows)
+    if rows.dtype == RECORD_DTYPE:
+        return rows.reshape(-1)
+    rows = np.asarray(rows, dtype=np.float64)
+    if rows.size == 0:
+        return empty_rows()
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    if rows.shape[1] != ROW_WIDTH:
+        # Older versions stored every number of the fourth line, keep session, totals and timestamp
+        rows = rows[:, [0, 1, -3, -2, -1]]
+    records = np.empty(len(rows), dtype=RECORD_DTYPE)
+    for column, name in enumerate(FIELDS):
+        records[name] = np.rint(rows[:, column])
+    return records
+
+
+def _file_header():
+    return HEADER.pack(FILE_MAGIC, FORMAT_VERSION, RECORD_SIZE, ROW_WIDTH).ljust(HEADER_SIZE, b"\0")
+
+
+def _has_header(f):
+    """Reads the header of an open file, False for a version 1 file without one."""
+    header = f.read(HEADER_SIZE)
+    if not header.startswith(FILE_MAGIC):
+        return False
+    _, version, record_size, _ = HEADER.unpack_from(header)
+    if version != FORMAT_VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"{f.name} has unsupported format version {version}")
+    return True
+
+
+def _read_records(file_path):
+    with open(file_path, "rb") as f:
+        if _has_header(f):
+            count = (os.fstat(f.fileno()).st_size - HEADER_SIZE) // RECORD_SIZE  # Ignore a record cut off by a crash
+            return np.fromfile(f, dtype=RECORD_DTYPE, count=count)
+        f.seek(0)
+        data = np.fromfile(f, dtype=V1_DTYPE)
+    complete = data.size - data.size % ROW_WIDTH
+    return to_records(data[:complete].reshape(-1, ROW_WIDTH))
+
+
+def _write_records(file_path, rows):
+    """Replaces a file with a header and the given records."""
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_file_header())
+        f.write(rows.tobytes())
+    os.replace(tmp_path, file_path)
+
+
+def _read_legacy(folder, user_id):
+    """History from a flat "<user_id>.hb" or "<user_id>.json" file, or None."""
+    file_path = flat_log_path(folder, user_id)
+    if file_path.exists():
+        return _read_records(file_path)
+    file_path = legacy_path(folder, user_id)
+    if file_path.exists():
+        with open(file_path, "r") as f:
+            return to_records(json.load(f))
+    return None
+
+
+def _prepare_append(file_path):
+    """
+    Makes an existing partition file ready for appending: converts a version 1 file and
+    drops a partially written record left behind by a crash during an append.
+    """
+    with open(file_path, "rb") as f:
+        current = _has_header(f)
+    if not current:
+        _write_records(file_path, _read_records(file_path))
+        return
+    size = file_path.stat().st_size
+    if size % RECORD_SIZE:  # The header is one record long
+        with open(file_path, "r+b") as f:
+            f.truncate(size - size % RECORD_SIZE)
+
+
+################################################################################
+# Manifest
+################################################################################
+def read_manifest(folder, user_id):
+    """[{"name", "start", "end", "tier"}, ...] of the user's partitions, oldest first."""
+    return _read_manifest(user_folder(folder, user_id))
+
+
+def _read_manifest(user_dir):
+    file_path = user_dir / MANIFEST_NAME
+    if not file_path.exists():
+        return []
+    with open(file_path, "r") as f:
+        return json.load(f)["partitions"]
+
+
+def _write_manifest(user_dir, partitions):
+    file_path = user_dir / MANIFEST_NAME
+    tmp_path = file_path.with_name(MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "partition_seconds": PARTITION_SECONDS, "partitions": partitions}, f)
+    os.replace(tmp_path, file_path)
+
+
+def _partition_path(user_dir, partition):
+    return user_dir / f"{partition['name']}{LOG_SUFFIX}"
+
+
+################################################################################
+# Writing
+################################################################################
+def _append_partitioned(user_dir, rows):
+    """Appends rows to their week partitions, creating partitions as needed."""
+    partitions = _read_manifest(user_dir)
+    newest_start = partitions[-1]["start"] if partitions else None
+    starts = np.array([partition_start(ts) for ts in rows["ts"]], dtype=np.int64)
+    if newest_start is not None:
+        # A clock that went back never writes into an older partition, rows stay in append order
+        starts = np.maximum(starts, newest_start)
+    starts = np.maximum.accumulate(starts)
+
+    # New partitions go into the manifest before any row is written to them
+    new_starts = [int(start) for start in np.unique(starts) if newest_start is None or start > newest_start]
+    if new_starts:
+        partitions += [{"name": partition_name(start), "start": start, "end": start + PARTITION_SECONDS, "tier": "raw"}
+                       for start in new_starts]
+        _write_manifest(user_dir, partitions)
+
+    by_start = {partition["start"]: partition for partition in partitions[-len(new_starts) - 1:]}
+    for start in np.unique(starts):
+        file_path = _partition_path(user_dir, by_start[int(start)])
+        if file_path.exists() and file_path.stat().st_size:
+            _prepare_append(file_path)
+            with open(file_path, "ab") as f:
+                f.write(rows[starts == start].tobytes())
+        else:
+            _write_records(file_path, rows[starts == start])  # Never leaves a file with half a header
+
+
+def migrate_legacy(folder, user_id):
+    """Splits a flat "<user_id>.hb" or "<user_id>.json" history into week partitions."""
+    rows = _read_legacy(folder, user_id)
+    if rows is None:
+        return False
+
+    # Built next to the final folder and renamed, so a crash never leaves half a history behind
+    tmp_dir = Path(folder) / f"{user_id}.migrating"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    _write_manifest(tmp_dir, [])
+    if len(rows):
+        _append_partitioned(tmp_dir, rows)
+    os.replace(tmp_dir, user_folder(folder, user_id))
+
+    for file_path in (flat_log_path(folder, user_id), legacy_path(folder, user_id)):
+        if file_path.exists():
+            file_path.unlink()
+    return True
+
+
+def append_rows(folder, user_id, rows):
+    """Appends heartbeat rows to the end of the user's log."""
+    rows = to_records(rows)
+    if rows.size == 0:
+        return
+
+    user_dir = user_folder(folder, user_id)
+    if not user_dir.is_dir():
+        if not migrate_legacy(folder, user_id):
+            user_dir.mkdir(parents=True)
+    _append_partitioned(user_dir, rows)
+
+
+def compact_user(folder, user_id, raw_cutoff, hourly_cutoff):
+    """
+    Rolls up partitions that ended before raw_cutoff to hourly rows and those that ended
+    before hourly_cutoff to daily rows. Returns the number of rows removed.
+    """
+    if not user_folder(folder, user_id).is_dir():
+        migrate_legacy(folder, user_id)  # Users that stopped before partitioning are converted here
+    user_dir = user_folder(folder, user_id)
+
+    partitions = _read_manifest(user_dir)
+    removed = 0
+    changed = False
+    for partition in partitions:
+        if partition["end"] <= hourly_cutoff:
+            target = "daily"
+        elif partition["end"] <= raw_cutoff:
+            target = "hourly"
+        else:
+            break  # Partitions are ordered, the rest is newer
+        if TIERS[target] <= TIERS[partition.get("tier", "raw")]:
+            continue
+
+        file_path = _partition_path(user_dir, partition)
+        if file_path.exists():
+            rows = _read_records(file_path)
+            rolled = rollup_rows(rows, TIERS[target])
+            # The manifest is updated after the file, rolling up again after a crash keeps the same rows
+            _write_records(file_path, rolled)
+            removed += len(rows) - len(rolled)
+        partition["tier"] = target
+        changed = True
+
+    if changed:
+        _write_manifest(user_dir, partitions)
+    return removed
+
+
+################################################################################
+# Reading
+################################################################################
+def read_rows(folder, user_id, since=None, until=None):
+    """
+    Loads the heartbeat history of a user as a RECORD_DTYPE array.
+    With since/until only rows with since <= unix_ts < until are returned and only
+    the partitions overlapping that window are read.
+    """
+    if user_folder(folder, user_id).is_dir():
+        chunks = []
+        for partition in read_manifest(folder, user_id):
+            if since is not None and partition["end"] <= since:
+                continue
+            if until is not None and partition["start"] >= until:
+                continue
+            file_path = _partition_path(user_folder(folder, user_id), partition)
+            if file_path.exists():
+                chunks.append(_read_records(file_path))
+        rows = np.concatenate(chunks) if chunks else empty_rows()
+    else:
+        rows = _read_legacy(folder, user_id)
+        if rows is None:
+            return empty_rows()
+
+    if since is not None:
+        rows = rows[rows["ts"] >= since]
+    if until is not None:
+        rows = rows[rows["ts"] < until]
+    return rows
+
+
+def read_last_row(folder, user_id):
+    """Reads only the newest row of a user's history, or None if there is no history."""
+    if user_folder(folder, user_id).is_dir():
+        for partition in reversed(read_manifest(folder, user_id)):
+            file_path = _partition_path(user_folder(folder, user_id), partition)
+            if not file_path.exists():
+                continue
+            with open(file_path, "rb") as f:
+                if not _has_header(f):
+                    rows = _read_records(file_path)
+                    if len(rows):
+                        return rows[-1]
+                    continue
+                count = (os.fstat(f.fileno()).st_size - HEADER_SIZE) // RECORD_SIZE
+                if count:
+                    f.seek(HEADER_SIZE + (count - 1) * RECORD_SIZE)
+                    return np.frombuffer(f.read(RECORD_SIZE), dtype=RECORD_DTYPE)[0]
+        return None
+
+    rows = _read_legacy(folder, user_id)
+    return rows[-1] if rows is not None and len(rows) else None
+
+
+def list_users(folder):
+    """Returns the ids of every user with stored history in the folder."""
+    users = set()
+    for file in Path(folder).iterdir():
+        if file.is_dir():
+            if "." not in file.name and (file / MANIFEST_NAME).exists():  # Skips unfinished "<id>.migrating" folders
+                users.add(file.name)
+        elif file.suffix in (LOG_SUFFIX, LEGACY_SUFFIX):
+            users.add(file.stem)
+    return users
+
+
+def last_modified(folder, user_id):
+    """Newest modification time of a user's history, 0.0 if there is none."""
+    user_dir = user_folder(folder, user_id)
+    if user_dir.is_dir():
+        # Appends only touch the newest partition and the manifest, rewrites replace files in the folder
+        partitions = [name for name in os.listdir(user_dir) if name.endswith(LOG_SUFFIX)]
+        paths = [user_dir, user_dir / MANIFEST_NAME] + ([user_dir / max(partitions)] if partitions else [])
+    else:
+        paths = [flat_log_path(folder, user_id), legacy_path(folder, user_id)]
+    return max((path.stat().st_mtime for path in paths if path.exists()), default=0.0)
+
+
+def history_files(folder, user_id):
+    """Every file or folder that belongs to a user's history, used when moving a user's data."""
+    paths = (user_folder(folder, user_id), flat_log_path(folder, user_id), legacy_path(folder, user_id))
+    return [path for path in paths if path.exists()]
+
+
+def remove_history(path):
+    """Deletes a history file or partition folder returned by history_files."""
+    if Path(path).is_dir():
+        shutil.rmtree(path)
+    else:
+        Path(path).unlink()
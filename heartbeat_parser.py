@@ -0,0 +1,57 @@
+import re
+from dataclasses import dataclass
+
+################################################################################
+# Heartbeat parser
+#
+# A heartbeat message of the reroll bot looks like this:
+#     <123456789012345678-2>        user id, "-N" for an alt account
+#     Online: Main, 1, 2, 3         one number per online instance
+#     Offline: 4                    one number per offline instance
+#     Time: 47m Packs: 123          session minutes and packs
+# Only the first four lines are looked at, every line is scanned once.
+################################################################################
+USER_ID_PATTERN = re.compile(r"<(\d+)(?:-(\d+))?>")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+@dataclass
+class Heartbeat:
+    __slots__ = ("user_id", "main_id", "alt", "online", "offline", "minutes", "packs", "timestamp")
+    user_id: str  # Full id as in the message, "<main_id>-<alt>" for alts
+    main_id: str
+    alt: str  # Alt suffix, "" for the main account
+    online: int  # Online instances
+    offline: int  # Offline instances
+    minutes: int  # Session time
+    packs: int  # Session packs
+    timestamp: int  # Unix timestamp of the message
+
+    @property
+    def instances(self):
+        return self.online + self.offline
+
+    @property
+    def pph(self):
+        """Packs per hour of the session."""
+        return self.packs / self.minutes * 60 if self.minutes else 0
+
+
+def parse_heartbeat(content, timestamp):
+    """Parses a heartbeat message, returns None if it is not a complete heartbeat."""
+    lines = content.split("\n", 4)
+    if len(lines) < 4:
+        return None
+
+    match = USER_ID_PATTERN.search(lines[0])
+    if match is None:
+        return None
+
+    numbers = NUMBER_PATTERN.findall(lines[3])
+    if len(numbers) < 2:
+        return None
+
+    main_id, alt = match.groups()
+    return Heartbeat(match.group(0)[1:-1], main_id, alt or "",
+                     len(NUMBER_PATTERN.findall(lines[1])), len(NUMBER_PATTERN.findall(lines[2])),
+                     int(numbers[0]), int(numbers[1]), timestamp)
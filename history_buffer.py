@@ -0,0 +1,54 @@
+import numpy as np
+
+from heartbeat_log import RECORD_DTYPE, to_records
+
+MIN_CAPACITY = 16  # Rows reserved for a user without any history
+
+
+class HistoryBuffer:
+    """
+    Holds one user's heartbeat history in a capacity-doubling NumPy array.
+    Appending a row is amortized O(1); view() returns the filled rows without copying.
+    """
+    __slots__ = ("_data", "_size")
+
+    def __init__(self, rows=None):
+        rows = np.zeros(0, dtype=RECORD_DTYPE) if rows is None else to_records(rows)
+        self._size = len(rows)
+        self._data = np.zeros(max(MIN_CAPACITY, self._size * 2), dtype=RECORD_DTYPE)
+        self._data[:self._size] = rows
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def size(self):
+        """Number of stored records, same meaning as ndarray.size."""
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    @property
+    def nbytes(self):
+        """Memory held by the buffer, including unused capacity."""
+        return self._data.nbytes
+
+    def view(self):
+        """Returns the filled part of the buffer as a RECORD_DTYPE array view."""
+        return self._data[:self._size]
+
+    def last(self):
+        """Returns the newest row, or None if the buffer is empty."""
+        return self._data[self._size - 1] if self._size else None
+
+    def append(self, row):
+        """Adds one row and returns it as stored in the buffer."""
+        if self._size == len(self._data):
+            grown = np.zeros(len(self._data) * 2, dtype=RECORD_DTYPE)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size] = row
+        self._size += 1
+        return self._data[self._size - 1]
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+
+from history_buffer import HistoryBuffer
+
+
+def _summary(row):
+    return int(row["total_time"]), int(row["total_packs"]), int(row["ts"])
+
+
+class HistoryCache:
+    """
+    Keeps the heartbeat history of recently active users in memory.
+
+    A user's history is loaded with loader(user_id) the first time it is needed and the
+    least recently used users are dropped once there are more than max_users resident
+    or their buffers use more than max_bytes. Only (total_time, total_packs, last_ts) of
+    every user stays in memory for good, which is all /check all needs.
+    can_evict(user_id) can keep a user resident, for example while writes are queued.
+    """
+
+    def __init__(self, loader, max_users=200, max_bytes=64 * 1024 * 1024, can_evict=None):
+        self.loader = loader
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.can_evict = can_evict or (lambda user_id: True)
+        self._buffers = OrderedDict()  # user_id -> HistoryBuffer, oldest use first
+        self._bytes = 0
+        self.summaries = {}  # user_id -> (total_time, total_packs, last_ts)
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def __contains__(self, user_id):
+        """True if the user has stored history, loaded or not."""
+        return user_id in self._buffers or user_id in self.summaries
+
+    def is_resident(self, user_id):
+        return user_id in self._buffers
+
+    def load_summaries(self, summaries):
+        """Sets the hot per-user totals, {user_id: (total_time, total_packs, last_ts)}."""
+        self.summaries = dict(summaries)
+
+    def restore(self, user_id, rows):
+        """Puts an already loaded history in memory, used when starting from a snapshot."""
+        history = HistoryBuffer(rows)
+        old = self._buffers.pop(user_id, None)
+        self._bytes += history.nbytes - (old.nbytes if old is not None else 0)
+        self._buffers[user_id] = history
+        if len(history):
+            self.summaries[user_id] = _summary(history.last())
+        self._evict()
+
+    def resident_items(self):
+        """(user_id, HistoryBuffer) of every history in memory, least recently used first."""
+        return list(self._buffers.items())
+
+    def get(self, user_id):
+        """Returns the user's HistoryBuffer, loading it if it is not resident."""
+        history = self._buffers.get(user_id)
+        if history is not None:
+            self.hits += 1
+            self._buffers.move_to_end(user_id)
+            return history
+
+        self.misses += 1
+        history = HistoryBuffer(self.loader(user_id))
+        self._buffers[user_id] = history
+        self._bytes += history.nbytes
+        if len(history):
+            self.summaries[user_id] = _summary(history.last())
+        self._evict()
+        return history
+
+    def append(self, user_id, row):
+        """Appends a row to the user's history and updates the user's totals."""
+        history = self.get(user_id)
+        nbytes = history.nbytes
+        stored = history.append(row)
+        self._bytes += history.nbytes - nbytes
+        self.summaries[user_id] = _summary(stored)
+        if history.nbytes != nbytes:
+            self._evict()
+        return stored
+
+    def pop(self, user_id):
+        """Forgets a user completely, used when a user is retired."""
+        history = self._buffers.pop(user_id, None)
+        if history is not None:
+            self._bytes -= history.nbytes
+        self.summaries.pop(user_id, None)
+        return history
+
+    def _evict(self):
+        if len(self._buffers) <= self.max_users and self._bytes <= self.max_bytes:
+            return
+        # The newest user is never evicted, it is the one that is being used right now
+        for user_id in list(self._buffers)[:-1]:
+            if len(self._buffers) <= self.max_users and self._bytes <= self.max_bytes:
+                break
+            if not self.can_evict(user_id):
+                continue
+            self._bytes -= self._buffers.pop(user_id).nbytes
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "resident_users": len(self._buffers),
+            "known_users": len(self.summaries),
+            "resident_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
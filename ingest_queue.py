@@ -0,0 +1,89 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class IngestQueue:
+    """
+    Bounded queue of heartbeats from one source, drained by one worker.
+
+    Heartbeats are grouped per user: get_batch() returns every waiting heartbeat of the
+    user that has been waiting longest, so the worker can store every row but update the
+    status board once. When max_items heartbeats are waiting, put() waits for room and
+    drops the heartbeat after put_timeout seconds. Must be created inside the event loop.
+    """
+
+    def __init__(self, max_items=1000, put_timeout=10.0):
+        self.max_items = max_items
+        self.put_timeout = put_timeout
+        self._pending = OrderedDict()  # user_id -> [item, ...], user waiting longest first
+        self._items = 0
+        self._unfinished = 0  # Items queued or being handled, join() waits for 0
+        self._condition = asyncio.Condition()
+
+        # Counters
+        self.enqueued = 0
+        self.coalesced = 0  # Items that were handled in the same batch as an older item of their user
+        self.high_water = 0
+        self.delayed = 0  # put() calls that had to wait for room
+        self.total_delay = 0.0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._items
+
+    async def put(self, user_id, item):
+        """Queues an item for the user, returns False if it was dropped because the queue stayed full."""
+        async with self._condition:
+            if self._items >= self.max_items:
+                self.delayed += 1
+                start = time.monotonic()
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._items < self.max_items),
+                                           self.put_timeout)
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    return False
+                finally:
+                    self.total_delay += time.monotonic() - start
+
+            self._pending.setdefault(user_id, []).append(item)  # A waiting user keeps its place
+            self._items += 1
+            self._unfinished += 1
+            self.enqueued += 1
+            self.high_water = max(self.high_water, self._items)
+            self._condition.notify_all()
+            return True
+
+    async def get_batch(self):
+        """Waits for items and returns (user_id, items) of the user waiting longest, oldest item first."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._pending)
+            user_id, items = self._pending.popitem(last=False)
+            self._items -= len(items)
+            self.coalesced += len(items) - 1
+            self._condition.notify_all()
+            return user_id, items
+
+    async def task_done(self, count=1):
+        """Marks items returned by get_batch as handled."""
+        async with self._condition:
+            self._unfinished -= count
+            self._condition.notify_all()
+
+    async def join(self):
+        """Waits until every queued item has been handled."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._unfinished == 0)
+
+    def stats(self):
+        return {
+            "depth": self._items,
+            "users": len(self._pending),
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "delayed": self.delayed,
+            "avg_delay_ms": self.total_delay / self.delayed * 1000 if self.delayed else 0.0,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+
+class RefreshScheduler:
+    """
+    Runs refresh() when something changed instead of on a fixed timer.
+
+    mark_dirty() asks for a refresh, it runs debounce seconds later so the changes of
+    that window go out together, and never sooner than min_interval seconds after the
+    previous refresh. Without changes it still runs every idle_interval seconds, which
+    keeps time dependent content such as relative ages up to date.
+    """
+
+    def __init__(self, refresh, debounce=5, min_interval=10, idle_interval=60, clock=time.monotonic):
+        self.refresh = refresh
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.idle_interval = idle_interval
+        self.clock = clock
+        self.dirty_since = None  # When the first change since the last refresh was marked
+        self.last_refresh = float("-inf")
+        self._wakeup = asyncio.Event()
+
+        # Counters
+        self.refreshes = 0
+        self.idle_refreshes = 0  # Refreshes without changes, only the ages moved on
+        self.marks = 0
+
+    def mark_dirty(self):
+        self.marks += 1
+        if self.dirty_since is None:
+            self.dirty_since = self.clock()
+            self._wakeup.set()
+
+    def next_due(self):
+        """Clock time of the next refresh."""
+        due = self.last_refresh + self.idle_interval
+        if self.dirty_since is not None:
+            due = min(due, max(self.dirty_since + self.debounce, self.last_refresh + self.min_interval))
+        return due
+
+    async def refresh_now(self):
+        if self.dirty_since is None:
+            self.idle_refreshes += 1
+        self.dirty_since = None  # Changes marked while refresh() runs get a refresh of their own
+        self.last_refresh = self.clock()
+        self.refreshes += 1
+        await self.refresh()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()  # Before next_due(), so a mark_dirty() in between is not missed
+            delay = self.next_due() - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.refresh_now()
+            except Exception as e:
+                print(f"Error refreshing: {e}")
+
+    def stats(self):
+        return {"refreshes": self.refreshes, "idle_refreshes": self.idle_refreshes, "marks": self.marks}
@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+
+import numpy as np
+
+################################################################################
+# Offline replay harness
+#
+#     python replay.py heartbeat_corpus.jsonl [--speed 60] [--workdir DIR] [--verbose]
+#
+# Loads HMB_4.3.5.py without connecting to Discord and feeds a recorded corpus through
+# its real on_message and heartbeat workers, with local fake channels in place of the
+# Discord ones. The bot's clock follows the replayed messages, so the status board
+# scheduler and the write-behind flushes run at the same points in time as they would have live.
+#
+# The corpus has one JSON object per line:
+#     {"content": "...", "created_at": 1760000009, "author_id": ..., "channel_id": ...}
+# created_at is a Unix timestamp or an ISO date, author_id and channel_id default to the
+# heartbeat webhook and channel of the bot. A text file with one message per block of
+# lines (blocks separated by an empty line) is read as messages 10 seconds apart.
+################################################################################
+BOT_FILE = Path(__file__).resolve().with_name("HMB_4.3.5.py")
+TEXT_MESSAGE_INTERVAL = 10  # Seconds between the messages of a text corpus
+
+
+class ReplayClock:
+    """Replaces the time module inside the bot, time() returns the replayed time."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class FakeUser:
+    def __init__(self, user_id, bot=True):
+        self.id = user_id
+        self.bot = bot  # Webhooks are bots, so process_commands ignores the messages
+
+
+class FakeMessage:
+    def __init__(self, message_id, author, channel, content, created_at):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.created_at = created_at
+        self.edits = 0
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+        self.edits += 1
+        return self
+
+    async def delete(self):
+        self.channel.sent.remove(self)
+
+
+class FakeChannel:
+    """Collects what the bot sends instead of posting it."""
+
+    def __init__(self, channel_id, clock, message_ids):
+        self.id = channel_id
+        self.clock = clock
+        self.message_ids = message_ids
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(next(self.message_ids), FakeUser(0), self, content,
+                              datetime.fromtimestamp(self.clock.now, tz=timezone.utc))
+        self.sent.append(message)
+        return message
+
+
+class StageTimer:
+    """Wraps functions of the bot and records how long every call took."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, name, func):
+        samples = self.samples[name]
+        if asyncio.iscoroutinefunction(func):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        return timed
+
+    def report(self):
+        lines = [f"{'stage':>16} {'calls':>7} {'mean µs':>10} {'p50 µs':>10} {'p99 µs':>10} {'max µs':>10}"]
+        for name, samples in self.samples.items():
+            if samples:
+                micros = np.array(samples) * 1e6
+                lines.append(f"{name:>16} {len(micros):>7} {micros.mean():>10.1f} {np.percentile(micros, 50):>10.1f} "
+                             f"{np.percentile(micros, 99):>10.1f} {micros.max():>10.1f}")
+        return "\n".join(lines)
+
+
+def load_bot(workdir):
+    """Imports the bot with its data folders in workdir."""
+    sys.path.insert(0, str(BOT_FILE.parent))
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location("hmb", BOT_FILE)
+    bot_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot_module)
+    return bot_module
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+def load_corpus(path, author_id, channel_id):
+    """(message_id, author_id, channel_id, content, unix_ts) of every message, oldest first."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if Path(path).suffix == ".jsonl":
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        blocks = [block.strip("\n") for block in text.split("\n\n") if block.strip()]
+        records = [{"content": block, "created_at": i * TEXT_MESSAGE_INTERVAL} for i, block in enumerate(blocks)]
+
+    messages = [(record.get("id"), int(record.get("author_id", author_id)), int(record.get("channel_id", channel_id)),
+                 record["content"], _timestamp(record["created_at"])) for record in records]
+    messages.sort(key=lambda message: message[4])  # Stable, messages of the same second keep their order
+    return messages
+
+
+def checksums(bot_module, board_content):
+    """Digests of the final state, two runs with the same corpus and code have the same ones."""
+    history = hashlib.sha256()
+    for user_id in sorted(bot_module.store.list_users()):
+        history.update(user_id.encode())
+        history.update(bot_module.store.read_heartbeats(user_id).tobytes())
+    rollers = json.dumps(sorted(status.to_list() for status in bot_module.user_messages.values()))
+    warnings = json.dumps(sorted(bot_module.last_warning_timestamps.items()))
+    return {
+        "history": history.hexdigest()[:16],
+        "rollers": hashlib.sha256(rollers.encode()).hexdigest()[:16],
+        "board": hashlib.sha256((board_content or "").encode()).hexdigest()[:16],
+        "warnings": hashlib.sha256(warnings.encode()).hexdigest()[:16],
+    }
+
+
+async def replay(bot_module, messages, speed, timer):
+    """Feeds the messages to on_message, returns (seconds, board content)."""
+    clock = ReplayClock()
+    message_ids = count(1)
+    # The bot's own messages are numbered apart, the corpus ids don't depend on how many pages the board has
+    sent_message_ids = count(10 ** 12)
+    channels = {}
+
+    async def get_channel(channel_id):
+        if channel_id not in channels:
+            channels[channel_id] = FakeChannel(channel_id, clock, sent_message_ids)
+        return channels[channel_id]
+
+    bot_module.time = clock
+    bot_module.get_channel = get_channel
+    bot_module.parse_heartbeat = timer.wrap("parse", bot_module.parse_heartbeat)
+    bot_module.ingest_heartbeats = timer.wrap("ingest", bot_module.ingest_heartbeats)
+    bot_module.save_fourth_line_numbers = timer.wrap("history", bot_module.save_fourth_line_numbers)
+    on_message = timer.wrap("on_message", bot_module.on_message)
+    bot_module.send_message_list = timer.wrap("board", bot_module.send_message_list)  # Looked up by the board scheduler
+    flush = timer.wrap("flush", bot_module.write_queue.flush)
+    schedulers = (bot_module.board_scheduler, bot_module.warning_scheduler)
+    for scheduler in schedulers:
+        scheduler.clock = clock.time
+    expiry = bot_module.expiry_timer  # Its clock is the bot's time.time(), the replayed one
+
+    flush_interval = bot_module.PERSIST_FLUSH_INTERVAL
+    clock.now = next_flush = messages[0][4] if messages else 0
+    previous_ts = None
+    bot_module.start_heartbeat_workers()  # Nothing to backfill from a corpus
+    start = time.perf_counter()
+    for message_id, author_id, channel_id, content, timestamp in messages:
+        if speed and previous_ts is not None:
+            await asyncio.sleep((timestamp - previous_ts) / speed)
+        previous_ts = timestamp
+
+        # The periodic work of the bot, at the replayed time it would have run
+        while (deadline := expiry.next_deadline()) is not None and deadline <= timestamp:
+            clock.now = max(clock.now, deadline)
+            expiry.expire_due()
+        while next_flush <= timestamp:
+            clock.now = next_flush
+            flush()
+            next_flush += flush_interval
+        for scheduler in schedulers:
+            while scheduler.next_due() <= timestamp:
+                clock.now = max(clock.now, scheduler.next_due())
+                await scheduler.refresh_now()
+
+        clock.now = timestamp
+        channel = await get_channel(channel_id)
+        await on_message(FakeMessage(message_id or next(message_ids), FakeUser(author_id), channel, content,
+                                     datetime.fromtimestamp(timestamp, tz=timezone.utc)))
+        await bot_module.wait_for_heartbeats()  # Applied by the source workers before the clock moves on
+
+    await bot_module.send_warning_digest()
+    await bot_module.send_message_list()
+    flush()
+    seconds = time.perf_counter() - start
+    # The pages joined back together, the same content as one message without the length limit
+    return seconds, "\n".join(message.content for message in bot_module.board_messages) or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays recorded heartbeats through the bot without Discord.")
+    parser.add_argument("corpus", help="JSONL corpus, or a text file with one message per block of lines")
+    parser.add_argument("--speed", type=float, default=0, help="Time scale, 60 replays an hour in a minute. 0 runs as fast as possible")
+    parser.add_argument("--workdir", help="Folder for the bot's data, a new temporary folder by default")
+    parser.add_argument("--verbose", action="store_true", help="Show what the bot prints")
+    args = parser.parse_args()
+
+    corpus_path = Path(args.corpus).resolve()
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="heartbeat-replay-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    bot_output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(bot_output):
+        bot_module = load_bot(workdir)
+    messages = load_corpus(corpus_path, bot_module.TARGET_USER_ID, bot_module.SOURCE_CHANNEL_ID)
+
+    timer = StageTimer()
+    with contextlib.redirect_stdout(bot_output):
+        seconds, board_content = asyncio.run(replay(bot_module, messages, args.speed, timer))
+
+    print(f"Replayed {len(messages)} messages from {corpus_path.name} in {seconds:.3f} s "
+          f"({len(messages) / seconds:,.0f} messages/s), data in {workdir}")
+    print(f"{len(bot_module.user_messages)} rollers online, {len(bot_module.store.list_users())} stored histories, "
+          f"{bot_module.expiry_timer.expired} expired entries")
+    edits = bot_module.board_editor.stats()
+    print(f"Status board: {len(bot_module.board_messages)} pages, {edits['performed']} edits, {edits['skipped']} skipped as unchanged")
+    print(timer.report())
+    for name, digest in checksums(bot_module, board_content).items():
+        print(f"{name:>16} {digest}")
+    bot_module.store.close()
+
+
+if __name__ == "__main__":
+    main()
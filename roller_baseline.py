@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Ewma:
+    """Exponentially weighted mean and variance of one value, O(1) per sample."""
+    __slots__ = ("mean", "var", "count")
+    mean: float
+    var: float
+    count: int
+
+    def update(self, value, alpha):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def drop(self, value, z, min_drop):
+        """Fraction value is below the mean, 0.0 unless it is both min_drop and z deviations below it."""
+        if self.mean <= 0:
+            return 0.0
+        drop = (self.mean - value) / self.mean
+        if drop < min_drop or self.mean - value < z * self.var ** 0.5:
+            return 0.0
+        return drop
+
+
+class BaselineTracker:
+    """
+    Usual packs per hour and online instances of every roller, to notice drops from their own normal.
+
+    check() compares a heartbeat with the roller's baseline and then adds it to the baseline,
+    so a lasting change becomes the new normal after a while. Nothing is flagged until a
+    roller has warmup samples. PPH samples are only taken once a session has run for
+    min_minutes, the rate at the start of a session says little.
+    """
+
+    def __init__(self, alpha=0.1, warmup=10, z=3.0, min_drop=0.25, min_minutes=30):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.z = z
+        self.min_drop = min_drop
+        self.min_minutes = min_minutes
+        self.baselines = {}  # user_id -> (pph Ewma, online Ewma)
+        self.flagged = 0
+
+    def __len__(self):
+        return len(self.baselines)
+
+    def is_warm(self, user_id):
+        """True if the roller has enough PPH samples to be judged by its own baseline."""
+        baseline = self.baselines.get(user_id)
+        return baseline is not None and baseline[0].count >= self.warmup
+
+    def check(self, user_id, pph, online, minutes):
+        """Adds the heartbeat to the baseline, returns [(name, value, usual), ...] of the values that dropped."""
+        baseline = self.baselines.get(user_id)
+        if baseline is None:
+            baseline = self.baselines[user_id] = (Ewma(0.0, 0.0, 0), Ewma(0.0, 0.0, 0))
+        pph_stats, online_stats = baseline
+
+        anomalies = []
+        if minutes >= self.min_minutes:
+            if pph_stats.count >= self.warmup and pph_stats.drop(pph, self.z, self.min_drop):
+                anomalies.append(("pph", pph, pph_stats.mean))
+            pph_stats.update(pph, self.alpha)
+        if online_stats.count >= self.warmup and online_stats.drop(online, self.z, self.min_drop):
+            anomalies.append(("online", online, online_stats.mean))
+        online_stats.update(online, self.alpha)
+
+        self.flagged += bool(anomalies)
+        return anomalies
+
+    def to_dict(self):
+        """Baselines as plain lists, for the snapshot."""
+        return {user_id: [pph.mean, pph.var, pph.count, online.mean, online.var, online.count]
+                for user_id, (pph, online) in self.baselines.items()}
+
+    def load(self, baselines):
+        for user_id, values in baselines.items():
+            self.baselines[user_id] = (Ewma(*values[:3]), Ewma(*values[3:]))
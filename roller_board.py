@@ -0,0 +1,62 @@
+from bisect import bisect_left, insort
+from itertools import count
+
+
+class RollerBoard:
+    """
+    Online rollers in last-seen order, with the totals shown on the status board.
+
+    Rollers are kept in a list sorted by (-timestamp, first seen), so the newest heartbeat
+    comes first. The totals are updated when a roller is added, replaced or removed and
+    describe(status) runs once per heartbeat, so a refresh only fills in the ages.
+    """
+
+    def __init__(self, describe):
+        self.describe = describe  # status -> (text before the age, text after the age, bold)
+        self._order = []  # (-timestamp, seq, user_id), newest first
+        self._rollers = {}  # user_id -> (key in _order, RollerStatus, describe(status))
+        self._seq = count()  # Keeps rollers with the same timestamp in the order they came online
+        self.instances = 0
+        self.pph = 0.0
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, user_id):
+        return user_id in self._rollers
+
+    def update(self, status):
+        """Adds the roller or replaces its previous heartbeat."""
+        entry = self._rollers.get(status.user_id)
+        if entry is not None:
+            self._remove(status.user_id)
+            seq = entry[0][1]
+        else:
+            seq = next(self._seq)
+        key = (-status.timestamp, seq, status.user_id)
+        insort(self._order, key)
+        self._rollers[status.user_id] = (key, status, self.describe(status))
+        self.instances += status.online
+        self.pph += status.pph
+
+    def remove(self, user_id):
+        """Takes the roller off the board, returns its status or None if it was not on it."""
+        if user_id not in self._rollers:
+            return None
+        return self._remove(user_id)
+
+    def lines(self, now):
+        """Board line of every roller, newest heartbeat first."""
+        for neg_timestamp, _, user_id in self._order:
+            before, after, bold = self._rollers[user_id][2]
+            line = f"{before} {(now + neg_timestamp) // 60}m {after}"
+            yield f"**{line}**" if bold else line
+
+    def _remove(self, user_id):
+        key, status, _ = self._rollers.pop(user_id)
+        del self._order[bisect_left(self._order, key)]
+        self.instances -= status.online
+        self.pph -= status.pph
+        if not self._order:
+            self.pph = 0.0  # Drop the rounding error the float sum picked up
+        return status
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class RollerStatus:
+    """Newest heartbeat of one roller. Alts ("<id>-N") are rollers of their own."""
+    __slots__ = ("user_id", "main_id", "alt", "message_id", "timestamp", "online", "instances", "minutes", "pph")
+    user_id: str  # Heartbeat user id, the key of the live status map
+    main_id: str  # Discord user id that is mentioned
+    alt: str  # Alt suffix, "" for the main account
+    message_id: int  # Newest heartbeat message
+    timestamp: int  # Unix timestamp of the newest heartbeat
+    online: int  # Online instances
+    instances: int  # Online and offline instances
+    minutes: int  # Session time
+    pph: float  # Packs per hour of the session
+
+    @classmethod
+    def from_heartbeat(cls, heartbeat, message_id):
+        return cls(heartbeat.user_id, heartbeat.main_id, heartbeat.alt, message_id, heartbeat.timestamp,
+                   heartbeat.online, heartbeat.instances, heartbeat.minutes, heartbeat.pph)
+
+    def to_list(self):
+        """Field values in __slots__ order, used for the snapshot."""
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
@@ -0,0 +1,62 @@
+import numpy as np
+
+################################################################################
+# Heartbeat rollups
+#
+# Old history is thinned out instead of aggregated into a new format, so every reader
+# keeps working on the same (time, packs, total_time, total_packs, ts) records.
+# Rows are grouped by session and by hour or day bucket, and of each group only these
+# rows are kept:
+#   - the first row, if it starts a session (keeps session boundaries and 0/0 rows)
+#   - the row with the highest session time and the one with the most session packs
+#   - the last row (keeps the cumulative totals at the end of the bucket)
+################################################################################
+HOUR = 60 * 60
+DAY = 24 * HOUR
+TIERS = {"raw": 0, "hourly": HOUR, "daily": DAY}  # Tier name -> bucket size
+
+
+def session_starts(rows):
+    """True for every row that starts a new session."""
+    starts = np.zeros(len(rows), dtype=bool)
+    if len(rows):
+        starts[0] = True
+        starts |= (rows["time"] == 0) & (rows["packs"] == 0)
+        starts[1:] |= rows["time"][1:] < rows["time"][:-1]  # Session time went back, the bot was restarted
+    return starts
+
+
+def rollup_rows(rows, bucket_seconds):
+    """Returns the rows kept when rolling up to buckets of bucket_seconds, in their original order."""
+    return rows[rollup_mask(rows, bucket_seconds)]
+
+
+def rollup_mask(rows, bucket_seconds):
+    """True for every row that is kept when rolling up to buckets of bucket_seconds."""
+    if len(rows) == 0:
+        return np.zeros(0, dtype=bool)
+    starts = session_starts(rows)
+    session_ids = np.cumsum(starts)
+    buckets = rows["ts"] // bucket_seconds
+
+    # Rows are ordered, so every (session, bucket) group is one run of rows
+    new_group = np.ones(len(rows), dtype=bool)
+    new_group[1:] = (session_ids[1:] != session_ids[:-1]) | (buckets[1:] != buckets[:-1])
+    group_starts = np.flatnonzero(new_group)
+    group_ends = np.append(group_starts[1:], len(rows))
+
+    keep = np.zeros(len(rows), dtype=bool)
+    keep[group_starts[starts[group_starts]]] = True
+    keep[group_ends - 1] = True
+    for start, end in zip(group_starts, group_ends):
+        if end - start > 2:
+            keep[start + np.argmax(rows["time"][start:end])] = True
+            keep[start + np.argmax(rows["packs"][start:end])] = True
+    return keep
+
+
+def tier_cutoffs(now, raw_days, hourly_days):
+    """Timestamps before which rows are rolled up hourly and daily, aligned to whole days."""
+    raw_cutoff = int(now - raw_days * DAY) // DAY * DAY
+    hourly_cutoff = int(now - hourly_days * DAY) // DAY * DAY
+    return raw_cutoff, min(hourly_cutoff, raw_cutoff)
@@ -0,0 +1,64 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from heartbeat_log import RECORD_DTYPE, empty_rows
+
+################################################################################
+# State snapshot
+#
+# One .npz file with everything the bot keeps in memory, so a restart can bulk-load
+# it instead of rebuilding the state from the per-user files:
+#   rows      every history kept in memory, concatenated into one RECORD_DTYPE array
+#   offsets   where each user's rows start and end in "rows"
+#   user_ids  the user of each offset range
+#   state     JSON with the remaining bot state (status board, warnings, ...)
+# The file is written next to the old one and swapped in with os.replace, so a crash
+# while writing never leaves a half written snapshot behind.
+################################################################################
+SNAPSHOT_VERSION = 2  # Version 1 stored float64 rows
+
+
+def write_snapshot(path, histories, state):
+    """Writes {user_id: RECORD_DTYPE rows} and a JSON-serializable state dict to path."""
+    path = Path(path)
+    user_ids = list(histories)
+    lengths = [len(histories[user_id]) for user_id in user_ids]
+    offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    rows = (np.concatenate([histories[user_id] for user_id in user_ids]).astype(RECORD_DTYPE, copy=False)
+            if user_ids else empty_rows())
+    state = dict(state, version=SNAPSHOT_VERSION)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, rows=rows, offsets=offsets, user_ids=np.array(user_ids, dtype=str),
+                 state=np.frombuffer(json.dumps(state).encode(), dtype=np.uint8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """Returns ({user_id: rows}, state) from a snapshot, or None if there is no usable snapshot."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            state = json.loads(data["state"].tobytes().decode())
+            if state.get("version") != SNAPSHOT_VERSION:
+                print(f"Ignoring snapshot {path} with version {state.get('version')}.")
+                return None
+            rows = data["rows"]
+            offsets = data["offsets"]
+            user_ids = data["user_ids"]
+    except Exception as e:
+        print(f"Could not read snapshot {path}: {e}")
+        return None
+
+    # Views into the one bulk-loaded array, no per-user copies
+    histories = {str(user_id): rows[offsets[i]:offsets[i + 1]] for i, user_id in enumerate(user_ids)}
+    return histories, state
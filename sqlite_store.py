@@ -0,0 +1,311 @@
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+
+from heartbeat_log import list_users, read_rows, to_records
+from rollup import DAY, HOUR, rollup_mask
+from tester_ledger import TesterLedger, list_testers, read_ledger
+
+################################################################################
+# SQLite storage backend
+#
+# Same methods as storage.FileStore, but every user lives in one WAL mode database.
+# user_summary holds the newest values of every user so the aggregate commands are
+# indexed queries instead of reading every file. Tester counts are kept in memory by
+# the bot (tester_ledger.py), removed reactions are deleted right away.
+#
+# One-shot migration from the JSON/log folders:
+#     python sqlite_store.py migrate [heartbeat.db]
+################################################################################
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS heartbeats (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    packs INTEGER NOT NULL,
+    total_time INTEGER NOT NULL,
+    total_packs INTEGER NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS heartbeats_user ON heartbeats (user_id, id);
+CREATE INDEX IF NOT EXISTS heartbeats_ts ON heartbeats (ts);
+
+CREATE TABLE IF NOT EXISTS user_summary (
+    user_id TEXT PRIMARY KEY,
+    total_time INTEGER NOT NULL,
+    total_packs INTEGER NOT NULL,
+    last_ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_summary_packs ON user_summary (total_packs);
+
+CREATE TABLE IF NOT EXISTS tester_reactions (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    reaction_number INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    reactor_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tester_reactions_user ON tester_reactions (user_id, id);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    user_id TEXT PRIMARY KEY,
+    hourly_until INTEGER NOT NULL,
+    daily_until INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS deleted_heartbeats (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    packs INTEGER NOT NULL,
+    total_time INTEGER NOT NULL,
+    total_packs INTEGER NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deleted_heartbeats_user ON deleted_heartbeats (user_id, id);
+
+CREATE TABLE IF NOT EXISTS deleted_tester_reactions (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    reaction_number INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    reactor_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deleted_tester_reactions_user ON deleted_tester_reactions (user_id, id);
+"""
+
+
+class SQLiteStore:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()  # One connection per thread, WAL lets readers run next to the writer
+        self._write_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, func, *args):
+        """Runs func(conn, *args) in a single transaction."""
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                return func(conn, *args)
+
+    # Heartbeat history
+    def append_heartbeats(self, user_id, rows):
+        rows = to_records(rows)
+        if len(rows):
+            self._write(self._insert_heartbeats, "heartbeats", user_id, rows)
+
+    @staticmethod
+    def _insert_heartbeats(conn, table, user_id, rows):
+        conn.executemany(
+            f"INSERT INTO {table} (user_id, time, packs, total_time, total_packs, ts) VALUES (?, ?, ?, ?, ?, ?)",
+            [(user_id, *row) for row in rows.tolist()])
+        if table == "heartbeats":
+            last_row = rows[-1].item()
+            conn.execute(
+                "INSERT INTO user_summary (user_id, total_time, total_packs, last_ts) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET total_time = excluded.total_time, "
+                "total_packs = excluded.total_packs, last_ts = excluded.last_ts",
+                (user_id, *last_row[2:]))
+
+    def read_heartbeats(self, user_id):
+        rows = self._connection().execute(
+            "SELECT time, packs, total_time, total_packs, ts FROM heartbeats WHERE user_id = ? ORDER BY id",
+            (user_id,)).fetchall()
+        return to_records(rows)  # Databases created before the typed records hold REAL values
+
+    def list_users(self):
+        return {row[0] for row in self._connection().execute("SELECT user_id FROM user_summary")}
+
+    def user_summary(self, user_id):
+        row = self._connection().execute(
+            "SELECT total_time, total_packs, last_ts FROM user_summary WHERE user_id = ?", (user_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def user_summaries(self):
+        return {user_id: (total_time, total_packs, last_ts) for user_id, total_time, total_packs, last_ts in
+                self._connection().execute("SELECT user_id, total_time, total_packs, last_ts FROM user_summary")}
+
+    def recent_heartbeats(self, since):
+        """Rows newer than the given Unix timestamp, as {user_id: rows}."""
+        grouped = {}
+        for user_id, *row in self._connection().execute(
+                "SELECT user_id, time, packs, total_time, total_packs, ts FROM heartbeats WHERE ts >= ? ORDER BY id",
+                (since,)):
+            grouped.setdefault(user_id, []).append(row)
+        return {user_id: to_records(rows) for user_id, rows in grouped.items()}
+
+    def compact(self, raw_cutoff, hourly_cutoff):
+        """Rolls up rows older than the cutoffs to hourly and daily rows (see rollup.py). Returns rows removed."""
+        removed = 0
+        for user_id in self.list_users():
+            removed += self._write(self._compact_user, user_id, raw_cutoff, hourly_cutoff)
+        return removed
+
+    @staticmethod
+    def _compact_user(conn, user_id, raw_cutoff, hourly_cutoff):
+        state = conn.execute("SELECT hourly_until, daily_until FROM rollup_state WHERE user_id = ?", (user_id,)).fetchone()
+        hourly_until, daily_until = state if state else (0, 0)
+
+        # Only the rows that crossed a cutoff since the last run are read
+        removed = 0
+        for bucket_seconds, start, end in ((DAY, daily_until, hourly_cutoff),
+                                           (HOUR, max(hourly_until, hourly_cutoff), raw_cutoff)):
+            if end <= start:
+                continue
+            rows = conn.execute(
+                "SELECT id, time, packs, total_time, total_packs, ts FROM heartbeats "
+                "WHERE user_id = ? AND ts >= ? AND ts < ? ORDER BY id", (user_id, start, end)).fetchall()
+            if not rows:
+                continue
+            ids = [row[0] for row in rows]
+            keep = rollup_mask(to_records([row[1:] for row in rows]), bucket_seconds)
+            dropped = [(row_id,) for row_id, kept in zip(ids, keep) if not kept]
+            conn.executemany("DELETE FROM heartbeats WHERE id = ?", dropped)
+            removed += len(dropped)
+
+        conn.execute(
+            "INSERT INTO rollup_state (user_id, hourly_until, daily_until) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET hourly_until = excluded.hourly_until, daily_until = excluded.daily_until",
+            (user_id, max(raw_cutoff, hourly_until), max(hourly_cutoff, daily_until)))
+        return removed
+
+    def top_users(self, limit):
+        return self._connection().execute(
+            "SELECT user_id, total_packs FROM user_summary ORDER BY total_packs DESC LIMIT ?", (limit,)).fetchall()
+
+    # Tester data
+    def list_testers(self):
+        return {row[0] for row in self._connection().execute("SELECT DISTINCT user_id FROM tester_reactions")}
+
+    def read_tester_ledger(self, user_id):
+        rows = self._connection().execute(
+            "SELECT reaction_number, ts, reactor_id FROM tester_reactions WHERE user_id = ? ORDER BY id",
+            (user_id,)).fetchall()
+        return TesterLedger([list(row) for row in rows]) if rows else None
+
+    def tester_summaries(self):
+        """{user_id: [count, last_test, tombstones]}, one query, removed reactions are already deleted."""
+        # With max(id) SQLite takes ts from the newest row, like TesterLedger.last_test
+        return {user_id: [count, last_test, 0] for user_id, count, last_test, _ in self._connection().execute(
+            "SELECT user_id, count(*), ts, max(id) FROM tester_reactions GROUP BY user_id")}
+
+    def changed_since(self, timestamp):
+        """Always None, the totals are read with two queries and the snapshot copy is not needed."""
+        return None
+
+    def apply_tester_ops(self, user_id, ops):
+        self._write(self._apply_tester_ops, user_id, ops)
+
+    @staticmethod
+    def _apply_tester_ops(conn, user_id, ops):
+        for op, payload in ops:
+            if op == "add":
+                reaction_number, timestamp, reactor_id = payload
+                conn.execute("INSERT INTO tester_reactions (user_id, reaction_number, ts, reactor_id) VALUES (?, ?, ?, ?)",
+                             (user_id, reaction_number, timestamp, reactor_id))
+            elif op == "remove":
+                reaction_number, timestamp, reactor_id = payload
+                # Remove the most recent matching entry
+                conn.execute(
+                    "DELETE FROM tester_reactions WHERE id = (SELECT max(id) FROM tester_reactions "
+                    "WHERE user_id = ? AND reaction_number = ? AND ts = ? AND reactor_id = ?)",
+                    (user_id, reaction_number, timestamp, reactor_id))
+            # "compact" has nothing to do, removed rows are already gone
+
+    # Retiring
+    def retire_user(self, user_id):
+        """Moves a user's rows to the deleted tables, returns status messages."""
+        moved_heartbeats, moved_tests = self._write(self._retire_user, user_id)
+        messages = []
+        if moved_heartbeats:
+            messages.append(f"User data for <@{user_id}> has been retired and moved to the deleted_userdata table.")
+        else:
+            messages.append(f"No data found for User ID: {user_id} in the userdata table.")
+        if moved_tests:
+            messages.append(f"Tester data for <@{user_id}> has been retired and moved to the deleted_testers table.")
+        else:
+            messages.append(f"No tester data found for User ID: {user_id} in the testers table.")
+        return messages
+
+    @staticmethod
+    def _retire_user(conn, user_id):
+        # A user retired before is replaced, like the files in the deleted folders
+        moved_heartbeats = conn.execute("SELECT count(*) FROM heartbeats WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if moved_heartbeats:
+            conn.execute("DELETE FROM deleted_heartbeats WHERE user_id = ?", (user_id,))
+            conn.execute("INSERT INTO deleted_heartbeats (user_id, time, packs, total_time, total_packs, ts) "
+                         "SELECT user_id, time, packs, total_time, total_packs, ts FROM heartbeats WHERE user_id = ? ORDER BY id",
+                         (user_id,))
+            conn.execute("DELETE FROM heartbeats WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM user_summary WHERE user_id = ?", (user_id,))
+
+        moved_tests = conn.execute("SELECT count(*) FROM tester_reactions WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if moved_tests:
+            conn.execute("DELETE FROM deleted_tester_reactions WHERE user_id = ?", (user_id,))
+            conn.execute("INSERT INTO deleted_tester_reactions (user_id, reaction_number, ts, reactor_id) "
+                         "SELECT user_id, reaction_number, ts, reactor_id FROM tester_reactions WHERE user_id = ? ORDER BY id",
+                         (user_id,))
+            conn.execute("DELETE FROM tester_reactions WHERE user_id = ?", (user_id,))
+        return moved_heartbeats, moved_tests
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def migrate_folders(store, data_folder="userdata", testers_folder="testers",
+                    deleted_userdata_folder="deleted_userdata", deleted_testers_folder="deleted_testers"):
+    """Copies every user from the folder layout into an empty SQLite store. Returns (users, testers) counts."""
+    def migrate(conn):
+        if conn.execute("SELECT count(*) FROM user_summary").fetchone()[0]:
+            raise RuntimeError(f"{store.path} already holds user data, migrate into a new database.")
+
+        users = 0
+        for table, folder in (("heartbeats", data_folder), ("deleted_heartbeats", deleted_userdata_folder)):
+            if Path(folder).is_dir():
+                for user_id in sorted(list_users(folder)):
+                    rows = read_rows(folder, user_id)
+                    if len(rows):
+                        SQLiteStore._insert_heartbeats(conn, table, user_id, rows)
+                        users += table == "heartbeats"
+
+        testers = 0
+        for table, folder in (("tester_reactions", testers_folder), ("deleted_tester_reactions", deleted_testers_folder)):
+            if Path(folder).is_dir():
+                for user_id in sorted(list_testers(folder)):
+                    entries = read_ledger(folder, user_id).entries()
+                    conn.executemany(
+                        f"INSERT INTO {table} (user_id, reaction_number, ts, reactor_id) VALUES (?, ?, ?, ?)",
+                        [(user_id, entry[0], entry[1], entry[2]) for entry in entries])
+                    testers += table == "tester_reactions"
+        return users, testers
+
+    # Databases created before the tester ledger have a tester_summary table nothing reads any more,
+    # dropped on its own so running migrate on such a database cleans it up even though it holds data
+    store._write(lambda conn: conn.execute("DROP TABLE IF EXISTS tester_summary"))
+    return store._write(migrate)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python sqlite_store.py migrate [database path]")
+        sys.exit(1)
+    database_path = sys.argv[2] if len(sys.argv) > 2 else "heartbeat.db"
+    migrated_users, migrated_testers = migrate_folders(SQLiteStore(database_path))
+    print(f"Migrated {migrated_users} users and {migrated_testers} testers into {database_path}.")
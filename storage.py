@@ -0,0 +1,174 @@
+import json
+import threading
+from pathlib import Path
+
+from heartbeat_log import append_rows, read_rows, read_last_row, list_users, history_files, remove_history, \
+    compact_user, last_modified
+from tester_ledger import read_ledger, append_ledger, write_ledger, list_testers, tester_files
+
+################################################################################
+# Storage backends
+#
+# The bot talks to one store object for userdata and tester data. FileStore keeps
+# the folder layout (one history log and one tester ledger per user),
+# SQLiteStore (sqlite_store.py) keeps everything in a single indexed database.
+# Both have the same methods, writes are called from the write-behind thread.
+#
+# Tester data is a list of [reaction_number, unix_ts, reactor_id] entries per user,
+# read as a TesterLedger (tester_ledger.py) when a tester's reactions first change.
+# At startup only the totals are needed: user_summaries() and tester_summaries(), or
+# for a FileStore the totals in the snapshot plus what changed_since() reports.
+# Tester writes are ops: ("add", entry), ("remove", entry) or ("compact", live_entries).
+################################################################################
+
+
+class FileStore:
+    name = "files"
+
+    def __init__(self, data_folder, testers_folder, deleted_userdata_folder, deleted_testers_folder):
+        self.data_folder = Path(data_folder)
+        self.testers_folder = Path(testers_folder)
+        self.deleted_userdata_folder = Path(deleted_userdata_folder)
+        self.deleted_testers_folder = Path(deleted_testers_folder)
+        self._history_lock = threading.Lock()  # Appends and compaction both rewrite manifests
+
+    # Heartbeat history
+    def append_heartbeats(self, user_id, rows):
+        with self._history_lock:
+            append_rows(self.data_folder, user_id, rows)
+
+    def read_heartbeats(self, user_id):
+        return read_rows(self.data_folder, user_id)
+
+    def list_users(self):
+        return list_users(self.data_folder)
+
+    def user_summary(self, user_id):
+        """(total_time, total_packs, last_ts) from the last row of the user's log, or None."""
+        last_row = read_last_row(self.data_folder, user_id)
+        if last_row is None:
+            return None
+        return int(last_row["total_time"]), int(last_row["total_packs"]), int(last_row["ts"])
+
+    def user_summaries(self):
+        """{user_id: (total_time, total_packs, last_ts)} from the last row of every log."""
+        summaries = {}
+        for user_id in self.list_users():
+            summary = self.user_summary(user_id)
+            if summary is not None:
+                summaries[user_id] = summary
+        return summaries
+
+    def changed_since(self, timestamp):
+        """(user_ids, tester_ids) whose files were modified at or after the Unix timestamp."""
+        users = {user_id for user_id in self.list_users() if last_modified(self.data_folder, user_id) >= timestamp}
+        testers = {user_id for user_id in self.list_testers()
+                   if any(path.stat().st_mtime >= timestamp for path in tester_files(self.testers_folder, user_id))}
+        return users, testers
+
+    def recent_heartbeats(self, since):
+        """Rows newer than the given Unix timestamp, as {user_id: rows}. Only recent partitions are read."""
+        recent = {}
+        for user_id in self.list_users():
+            rows = read_rows(self.data_folder, user_id, since=since)
+            if len(rows):
+                recent[user_id] = rows
+        return recent
+
+    def compact(self, raw_cutoff, hourly_cutoff):
+        """Rolls up old history of every user, see heartbeat_log.compact_user. Returns rows removed."""
+        removed = 0
+        for user_id in self.list_users():
+            with self._history_lock:  # Per user, appends only wait for one user's compaction
+                removed += compact_user(self.data_folder, user_id, raw_cutoff, hourly_cutoff)
+        return removed
+
+    def top_users(self, limit):
+        """(user_id, total_packs) of the users with the most packs, only the last row of each log is read."""
+        top_users = []
+        for user_id in self.list_users():
+            try:
+                last_row = read_last_row(self.data_folder, user_id)
+            except (json.JSONDecodeError, ValueError):
+                continue  # Skip corrupted history files
+            if last_row is not None:
+                top_users.append((user_id, int(last_row["total_packs"])))  # Total packs from last entry
+        return sorted(top_users, key=lambda x: x[1], reverse=True)[:limit]
+
+    # Tester data
+    def list_testers(self):
+        return list_testers(self.testers_folder)
+
+    def read_tester_ledger(self, user_id):
+        """The tester's TesterLedger, or None if there is no ledger."""
+        return read_ledger(self.testers_folder, user_id)
+
+    def tester_summaries(self):
+        """{user_id: [count, last_test, tombstones]}, every ledger is read."""
+        return {user_id: read_ledger(self.testers_folder, user_id).summary() for user_id in self.list_testers()}
+
+    def apply_tester_ops(self, user_id, ops):
+        """Appends queued add/remove ops to the tester's ledger, a compact op rewrites it first."""
+        records = []
+        for op, payload in ops:
+            if op == "compact":
+                write_ledger(self.testers_folder, user_id, payload)
+                records = []  # Already part of the live entries
+            else:
+                records.append(("+" if op == "add" else "-", payload))
+        if records:
+            append_ledger(self.testers_folder, user_id, records)
+
+    # Retiring
+    def retire_user(self, user_id):
+        """Moves a user's history and tester files to the deleted folders, returns status messages."""
+        with self._history_lock:  # Not while the user's history is being compacted
+            return self._retire_user(user_id)
+
+    def _retire_user(self, user_id):
+        messages = []
+        source_userdata_paths = history_files(self.data_folder, user_id)
+        if not source_userdata_paths:
+            messages.append(f"No data found for User ID: {user_id} in the userdata folder.")
+
+        for source_path in source_userdata_paths:
+            messages += self._move(source_path, self.deleted_userdata_folder / source_path.name, "userdata",
+                                   f"User data for <@{user_id}> has been retired and moved to the deleted_userdata folder.")
+
+        source_testers_paths = tester_files(self.testers_folder, user_id)
+        if not source_testers_paths:
+            messages.append(f"No tester data found for User ID: {user_id} in the testers folder.")
+
+        for source_path in source_testers_paths:
+            messages += self._move(source_path, self.deleted_testers_folder / source_path.name, "testers",
+                                   f"Tester data for <@{user_id}> has been retired and moved to the deleted_testers folder.")
+        return messages
+
+    @staticmethod
+    def _move(source_path, destination_path, kind, success_message):
+        messages = []
+        # If the file already exists in the deleted folder, remove it
+        if destination_path.exists():
+            try:
+                remove_history(destination_path)
+            except Exception as e:
+                messages.append(f"Failed to remove existing file in deleted_{kind} folder: {e}")
+        try:
+            source_path.rename(destination_path)
+            messages.append(success_message)
+        except Exception as e:
+            messages.append(f"An error occurred while moving the {kind} file: {e}")
+        return messages
+
+    def close(self):
+        pass
+
+
+def open_store(backend, data_folder, testers_folder, deleted_userdata_folder, deleted_testers_folder, sqlite_path=None):
+    """Creates the configured storage backend, "files" or "sqlite"."""
+    if backend == "sqlite":
+        from sqlite_store import SQLiteStore  # Only needed when the SQLite backend is used
+        return SQLiteStore(sqlite_path)
+    if backend != "files":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return FileStore(data_folder, testers_folder, deleted_userdata_folder, deleted_testers_folder)
@@ -0,0 +1,153 @@
+import json
+import os
+from pathlib import Path
+
+################################################################################
+# Tester reaction ledger
+#
+# Every tester gets a "<user_id>.ledger" file with one JSON record per line:
+#     ["+", reaction_number, unix_ts, reactor_id]   a 🧪 reaction was added
+#     ["-", reaction_number, unix_ts, reactor_id]   that reaction was removed again
+# Reactions only ever append a line. Removed reactions stay in the file as a pair of
+# records until the ledger is compacted, which rewrites it with only the live entries.
+# Old "<user_id>.json" reaction lists are still read and are converted to a ledger
+# the first time the tester is written to.
+################################################################################
+LEDGER_SUFFIX = ".ledger"
+LEGACY_SUFFIX = ".json"
+
+
+class TesterLedger:
+    """
+    The live reactions of one tester, kept up to date in O(1) per reaction.
+    Entries are [reaction_number, unix_ts, reactor_id], like the old JSON lists.
+    """
+    __slots__ = ("_entries", "_by_reactor", "count", "tombstones")
+
+    def __init__(self, entries=()):
+        self._entries = []  # [reaction_number, unix_ts, reactor_id, alive], removed entries are dropped lazily
+        self._by_reactor = {}  # reactor_id -> live entries of that reactor, newest last
+        self.count = 0
+        self.tombstones = 0  # Removals since the ledger was last compacted
+        for entry in entries:
+            self.add_entry(entry)
+
+    def add_entry(self, entry):
+        """Adds a stored [reaction_number, unix_ts, reactor_id] entry as it is."""
+        record = [entry[0], entry[1], str(entry[2]), True]
+        self._entries.append(record)
+        self._by_reactor.setdefault(record[2], []).append(record)
+        self.count += 1
+        return record[:3]
+
+    def add(self, reactor_id, timestamp):
+        """Adds a reaction and returns its entry."""
+        return self.add_entry([self.count + 1, timestamp, reactor_id])
+
+    def remove_latest(self, reactor_id):
+        """Removes the most recent reaction of the reactor and returns its entry, or None."""
+        stack = self._by_reactor.get(str(reactor_id))
+        if not stack:
+            return None
+        return self._kill(stack, len(stack) - 1)
+
+    def remove(self, entry):
+        """Removes the most recent reaction equal to entry, used when replaying a ledger."""
+        stack = self._by_reactor.get(str(entry[2]), [])
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index][0] == entry[0] and stack[index][1] == entry[1]:
+                return self._kill(stack, index)
+        return None
+
+    def _kill(self, stack, index):
+        record = stack.pop(index)
+        record[3] = False
+        self.count -= 1
+        self.tombstones += 1
+        while self._entries and not self._entries[-1][3]:
+            self._entries.pop()  # Keeps last_test O(1) amortized
+        return record[:3]
+
+    @property
+    def last_test(self):
+        """Unix timestamp of the newest live reaction, or None."""
+        return self._entries[-1][1] if self._entries else None
+
+    def summary(self):
+        """[count, last_test, tombstones], what the bot keeps of testers whose ledger is not loaded."""
+        return [self.count, self.last_test, self.tombstones]
+
+    def entries(self):
+        """Live entries, oldest first. Also drops the removed entries kept in memory."""
+        self._entries = [record for record in self._entries if record[3]]
+        return [record[:3] for record in self._entries]
+
+
+################################################################################
+# Files
+################################################################################
+def ledger_path(folder, user_id):
+    return Path(folder) / f"{user_id}{LEDGER_SUFFIX}"
+
+
+def legacy_path(folder, user_id):
+    return Path(folder) / f"{user_id}{LEGACY_SUFFIX}"
+
+
+def _read_legacy(folder, user_id):
+    file_path = legacy_path(folder, user_id)
+    if not file_path.exists():
+        return None
+    with open(file_path, "r") as f:
+        data = json.load(f)
+    return [entry for entry in data if len(entry) > 2] if isinstance(data, list) else []
+
+
+def read_ledger(folder, user_id):
+    """Replays a tester's ledger (or old JSON list) into a TesterLedger, or None if there is no file."""
+    file_path = ledger_path(folder, user_id)
+    if not file_path.exists():
+        entries = _read_legacy(folder, user_id)
+        return TesterLedger(entries) if entries is not None else None
+
+    ledger = TesterLedger()
+    with open(file_path, "r") as f:
+        for line in f:
+            try:
+                op, reaction_number, timestamp, reactor_id = json.loads(line)
+            except ValueError:
+                continue  # A line cut off by a crash
+            if op == "+":
+                ledger.add_entry([reaction_number, timestamp, reactor_id])
+            else:
+                ledger.remove([reaction_number, timestamp, reactor_id])
+    return ledger
+
+
+def write_ledger(folder, user_id, entries):
+    """Rewrites a tester's ledger with only the given live entries."""
+    file_path = ledger_path(folder, user_id)
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(json.dumps(["+", *entry]) + "\n" for entry in entries)
+    os.replace(tmp_path, file_path)
+
+
+def append_ledger(folder, user_id, records):
+    """Appends ("+" or "-", entry) records to a tester's ledger."""
+    file_path = ledger_path(folder, user_id)
+    if not file_path.exists():
+        entries = _read_legacy(folder, user_id)
+        if entries is not None:
+            write_ledger(folder, user_id, entries)
+            legacy_path(folder, user_id).unlink()
+    with open(file_path, "a") as f:
+        f.writelines(json.dumps([op, *entry]) + "\n" for op, entry in records)
+
+
+def list_testers(folder):
+    return {file.stem for file in Path(folder).iterdir() if file.suffix in (LEDGER_SUFFIX, LEGACY_SUFFIX)}
+
+
+def tester_files(folder, user_id):
+    return [path for path in (ledger_path(folder, user_id), legacy_path(folder, user_id)) if path.exists()]
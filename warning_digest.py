@@ -0,0 +1,73 @@
+import json
+import os
+import time
+
+
+class WarningDigest:
+    """
+    Collects the warnings triggered over a short window so they go out as one message.
+
+    add() queues a user's warning line unless the user is still in their cooldown, a
+    user warned twice in the same window only gets the newest line. take() hands over
+    everything queued and starts the cooldowns, which are kept in last_sent so they can
+    be saved and restored with write_cooldowns()/read_cooldowns().
+    """
+
+    def __init__(self, last_sent, cooldown, clock=time.time):
+        self.last_sent = last_sent  # user id -> time of the last warning sent to the user
+        self.cooldown = cooldown
+        self.clock = clock
+        self._pending = {}  # user id -> warning line, in the order the users were warned
+
+        # Counters
+        self.triggered = 0
+        self.suppressed = 0  # Warnings dropped because of the cooldown
+        self.digests = 0
+        self.warnings_sent = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, line):
+        """Queues the warning, returns False if the user is in their cooldown."""
+        if self.clock() - self.last_sent.get(user_id, 0) < self.cooldown:
+            self.suppressed += 1
+            return False
+        self._pending[user_id] = line
+        self.triggered += 1
+        return True
+
+    def take(self):
+        """Returns (time, [(user_id, line), ...]) of the queued warnings and starts their cooldowns."""
+        now = int(self.clock())
+        warnings = list(self._pending.items())
+        self._pending.clear()
+        for user_id, _ in warnings:
+            self.last_sent[user_id] = now
+        if warnings:
+            self.digests += 1
+            self.warnings_sent += len(warnings)
+        return now, warnings
+
+    def stats(self):
+        return {"pending": len(self._pending), "triggered": self.triggered, "suppressed": self.suppressed,
+                "digests": self.digests, "warnings_sent": self.warnings_sent}
+
+
+def read_cooldowns(path):
+    """{user_id: time of the last warning} saved by write_cooldowns, empty if there is no file."""
+    try:
+        with open(path, "r") as f:
+            return {user_id: int(sent) for user_id, sent in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Error reading warning cooldowns from {path}: {e}")
+        return {}
+
+
+def write_cooldowns(path, cooldowns):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cooldowns, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,125 @@
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """
+    Keeps disk writes away from the Discord event loop.
+
+    Callers mark a key (for example one user's history file) as dirty together with a
+    writer function, and a background thread flushes every dirty key in one batch
+    each flush_interval seconds. Appended items are written in the order they were
+    queued, replaced values only write the newest one.
+    """
+
+    def __init__(self, flush_interval=5.0, name="write-behind"):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Only one flush at a time so writes stay ordered
+        self._pending = {}  # key -> [writer, items or value, is_append]
+        self._in_flight = set()  # Keys taken by the running flush whose writes have not finished yet
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        # Counters
+        self.flush_count = 0
+        self.items_written = 0
+        self.write_errors = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def start(self):
+        if not self._thread.is_alive() and not self._stopped.is_set():
+            self._thread.start()
+
+    def append(self, key, writer, item):
+        """Queues an item, writer(items) is called once per flush with every item queued for the key."""
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [writer, [item], True]
+            else:
+                entry[1].append(item)
+
+    def replace(self, key, writer, value):
+        """Queues a full value for the key, only the newest value is written with writer(value)."""
+        with self._lock:
+            self._pending[key] = [writer, value, False]
+
+    def is_pending(self, key):
+        """True if something is queued for the key or being written and not written yet."""
+        with self._lock:
+            return key in self._pending or key in self._in_flight
+
+    def queue_depth(self):
+        """Number of dirty keys and number of items waiting to be written."""
+        with self._lock:
+            items = sum(len(entry[1]) if entry[2] else 1 for entry in self._pending.values())
+            return len(self._pending), items
+
+    def flush(self):
+        """Writes everything that is queued right now. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._in_flight.update(batch)
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            for key, (writer, payload, is_append) in batch.items():
+                try:
+                    writer(payload)
+                    self.items_written += len(payload) if is_append else 1
+                except Exception as e:
+                    self.write_errors += 1
+                    print(f"Error writing {key}: {e}")
+                    self._requeue(key, writer, payload, is_append)
+                finally:
+                    with self._lock:
+                        self._in_flight.discard(key)  # Written, or back in _pending to be retried
+
+            latency = time.perf_counter() - start
+            self.flush_count += 1
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.total_flush_latency += latency
+
+    def _requeue(self, key, writer, payload, is_append):
+        """Puts a failed write back in front of anything queued since, so it is retried next flush."""
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [writer, payload, is_append]
+            elif is_append and entry[2]:
+                entry[1][:0] = payload
+            # A newer replace value is already queued, the failed one is outdated
+
+    def stop(self):
+        """Stops the writer thread and flushes whatever is still queued."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        dirty_keys, queued_items = self.queue_depth()
+        return {
+            "dirty_keys": dirty_keys,
+            "queued_items": queued_items,
+            "flushes": self.flush_count,
+            "items_written": self.items_written,
+            "write_errors": self.write_errors,
+            "last_flush_ms": self.last_flush_latency * 1000,
+            "max_flush_ms": self.max_flush_latency * 1000,
+            "avg_flush_ms": self.total_flush_latency * 1000 / self.flush_count if self.flush_count else 0.0,
+        }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()